@@ -5,15 +5,27 @@
 ├── 📋 Уведомление о новых заявках (через Telegram Notifier в Google Apps Script)
 ├── ✏️ Изменение статуса заявки ("В работе", "Завершена")
 ├── 📞 Быстрый вызов клиента (инлайн-кнопка)
+├── 📊 Статистика заявок за O(1) (/stats)
+├── 🗄 Архивация завершённых заявок (/archive и по расписанию)
+├── ⏱ Профилирование по запросу (/profile N)
 """
 
+import asyncio
+import html
 import logging
 import sys
 import os
+from typing import Optional
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import Application, CallbackQueryHandler, ContextTypes, CommandHandler
-from services.gsheets import update_status
-from config import TELEGRAM_ADMIN_TOKEN, ADMIN_CHAT_ID
+from telegram.ext import Application, CallbackQueryHandler, ContextTypes, CommandHandler, MessageHandler, filters
+from telegram.request import BaseRequest
+from services.gsheets import update_status, gs_service, archive_completed
+from services.stats import request_stats, format_duration
+from services.profiler import profiler_service, ProfilerBusyError
+from services.traffic import get_recorder
+from config import Config
+
+ADMIN_CHAT_ID = Config.ADMIN_CHAT_ID
 
 logging.basicConfig(
     format="🛠 [%(asctime)s] %(name)s │ %(levelname)-8s │ %(message)s",
@@ -28,6 +40,10 @@ logger = logging.getLogger(__name__)
 
 # 🔔 Уведомление о новой заявке (вызывается Google Apps Script через Webhook)
 async def notify(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # В статистику пишем только данные из чата администратора
+    if str(update.effective_chat.id) != str(ADMIN_CHAT_ID):
+        return
+
     try:
         data = update.message.text  # Формат: ID;Адрес;Телефон;Дата;Статус
         if ";" not in data:
@@ -35,29 +51,33 @@ async def notify(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         id_, address, phone, date, status = data.split(";")
-        phone_url = "tel:" + phone.replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
+        request_stats.record_created(id_, status, date)
+        await _send_notification(context, id_, address, phone, date, status)
+    except Exception as e:
+        logger.exception("Ошибка при обработке уведомления: %s", e)
 
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("📞 Позвонить", url=phone_url)],
-            [
-                InlineKeyboardButton("🟡 В работе", callback_data=f"status|{id_}|В работе"),
-                InlineKeyboardButton("✅ Завершена", callback_data=f"status|{id_}|Завершена"),
-            ]
-        ])
+async def _send_notification(context: ContextTypes.DEFAULT_TYPE, id_: str, address: str,
+                             phone: str, date: str, status: str):
+    phone_url = "tel:" + phone.replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
 
-        msg = (
-            f"📬 <b>Новая заявка</b>\n\n"            f"<b>📍 Адрес:</b> {address}\n"            f"<b>📞 Телефон:</b> {phone}\n"            f"<b>🕒 Дата:</b> {date}\n"            f"<b>📌 Статус:</b> {status}"
-        )
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("📞 Позвонить", url=phone_url)],
+        [
+            InlineKeyboardButton("🟡 В работе", callback_data=f"status|{id_}|В работе"),
+            InlineKeyboardButton("✅ Завершена", callback_data=f"status|{id_}|Завершена"),
+        ]
+    ])
 
-        await context.bot.send_message(
-            chat_id=ADMIN_CHAT_ID,
-            text=msg,
-            parse_mode="HTML",
-            reply_markup=keyboard
-        )
-    except Exception as e:
-        logger.exception("Ошибка при обработке уведомления: %s", e)
-        logger.exception("Ошибка при обработке уведомления")
+    msg = (
+        f"📬 <b>Новая заявка</b>\n\n"        f"<b>📍 Адрес:</b> {address}\n"        f"<b>📞 Телефон:</b> {phone}\n"        f"<b>🕒 Дата:</b> {date}\n"        f"<b>📌 Статус:</b> {status}"
+    )
+
+    await context.bot.send_message(
+        chat_id=ADMIN_CHAT_ID,
+        text=msg,
+        parse_mode="HTML",
+        reply_markup=keyboard
+    )
 
 # 🔄 Обработка callback кнопок (смена статуса)
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -68,7 +88,10 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if query.data.startswith("status|"):
             _, row_id, new_status = query.data.split("|")
 
-            update_status(row_id, new_status)
+            # Запросы к таблице выполняем вне event loop
+            loop = asyncio.get_running_loop()
+            if not await loop.run_in_executor(None, update_status, row_id, new_status):
+                raise RuntimeError(f"Статус заявки {row_id} не обновлён")
 
             await query.edit_message_text(
                 text=f"📝 Статус заявки №{row_id} обновлён на: {new_status}"
@@ -80,19 +103,160 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # 🔄 Ручной тест уведомления (опционально)
 async def test(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Только сообщение: тестовая заявка не должна попадать в статистику
     fake = "42;г. Пример, ул. Ленина 10;+7-900-123-45-67;2025-04-29 15:42;Новая"
-    update.message.text = fake
-    await notify(update, context)
+    try:
+        await _send_notification(context, *fake.split(";"))
+    except Exception as e:
+        logger.exception("Ошибка при отправке тестового уведомления: %s", e)
 
-# 🚀 Запуск бота
-async def run_admin_bot():
-    app = Application.builder().token(TELEGRAM_ADMIN_TOKEN).build()
+# 📊 Статистика заявок: /stats [rebuild]
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if str(update.effective_chat.id) != str(ADMIN_CHAT_ID):
+        return
+
+    try:
+        if context.args and context.args[0] == "rebuild":
+            # Однократная перестройка по таблице, если снимка ещё нет
+            loop = asyncio.get_running_loop()
+            rows = await loop.run_in_executor(None, gs_service.get_all_requests)
+            request_stats.rebuild(rows)
+
+        summary = request_stats.summary()
+        statuses = "\n".join(
+            f"  {status}: {count}" for status, count in sorted(summary["statuses"].items())
+        ) or "  —"
+        msg = (
+            "<b>📊 Статистика заявок</b>\n\n"
+            f"<b>📌 По статусам</b> (всего {summary['total']}):\n{statuses}\n\n"
+            f"<b>🆕 Новые:</b> сегодня {summary['new_today']}, вчера {summary['new_yesterday']}, "
+            f"7 дн {summary['new_7d']}, 30 дн {summary['new_30d']}\n\n"
+            f"<b>⏱ От «Новая» до «Завершена»</b> ({summary['completed_measured']} заявок):\n"
+            f"  медиана {format_duration(summary['completion_p50'])}, "
+            f"p90 {format_duration(summary['completion_p90'])}"
+        )
+        await update.message.reply_text(msg, parse_mode="HTML")
+    except Exception as e:
+        logger.exception("Ошибка при формировании статистики: %s", e)
+        await update.message.reply_text("❌ Не удалось получить статистику.")
+
+# 🗄 Архивация завершённых заявок: /archive
+async def archive(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if str(update.effective_chat.id) != str(ADMIN_CHAT_ID):
+        return
+
+    await update.message.reply_text("🗄 Запускаю архивацию...")
+    try:
+        # Перенос строк — долгая серия запросов к API, выполняем вне event loop
+        loop = asyncio.get_running_loop()
+        moved = await loop.run_in_executor(None, archive_completed)
+        if not moved:
+            await update.message.reply_text("✅ Заявок для архивации нет.")
+            return
+        details = "\n".join(f"  {title}: {count}" for title, count in sorted(moved.items()))
+        await update.message.reply_text(f"✅ Перенесено заявок: {sum(moved.values())}\n{details}")
+    except Exception as e:
+        logger.exception("Ошибка архивации: %s", e)
+        await update.message.reply_text("❌ Не удалось выполнить архивацию.")
+
+async def archive_job(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, archive_completed)
+    except Exception:
+        logger.exception("Ошибка плановой архивации")
+
+async def stats_snapshot_job(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, request_stats.save)
+    except Exception:
+        logger.exception("Ошибка сохранения снимка статистики")
+
+async def stats_reconcile_job(context: ContextTypes.DEFAULT_TYPE):
+    # Статусы, изменённые прямо в таблице, приходят в статистику только так
+    try:
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(None, gs_service.get_live_requests)
+        request_stats.reconcile(rows)
+    except Exception:
+        logger.exception("Ошибка сверки статистики с таблицей")
+
+# ⏱ Профилирование event loop по запросу: /profile [секунды]
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if str(update.effective_chat.id) != str(ADMIN_CHAT_ID):
+        return
+
+    try:
+        duration = int(context.args[0]) if context.args else 30
+    except ValueError:
+        await update.message.reply_text("⚠️ Использование: /profile [секунды]")
+        return
+    duration = max(1, min(duration, Config.PROFILE_MAX_SECONDS))
+
+    if profiler_service.running:
+        await update.message.reply_text("⏳ Профилирование уже запущено.")
+        return
+
+    await update.message.reply_text(f"⏱ Снимаю профиль {duration} с...")
+    # Захват идёт в фоне, чтобы не блокировать обработку остальных обновлений
+    context.application.create_task(_run_profile(update, duration))
+
+async def _run_profile(update: Update, duration: int):
+    try:
+        report = await profiler_service.capture(duration)
+        await update.message.reply_text(f"<pre>{html.escape(report.format_summary())}</pre>", parse_mode="HTML")
+    except ProfilerBusyError:
+        await update.message.reply_text("⏳ Профилирование уже запущено.")
+    except Exception:
+        logger.exception("Ошибка при профилировании")
+        await update.message.reply_text("❌ Не удалось снять профиль.")
+
+# 🏗 Сборка приложения
+def build_admin_app(token: str, request: Optional[BaseRequest] = None) -> Application:
+    builder = Application.builder().token(token)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    app = builder.build()
+
+    recorder = get_recorder(Config.TRAFFIC_CAPTURE_PATH)
+    if recorder:
+        app.add_handler(recorder.handler("admin"), group=-1)
 
     app.add_handler(CommandHandler("test", test))
+    app.add_handler(CommandHandler("stats", stats))
+    app.add_handler(CommandHandler("archive", archive))
+    app.add_handler(CommandHandler("profile", profile))
     app.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), notify))
     app.add_handler(CallbackQueryHandler(handle_callback))
 
-    await app.run_polling()
+    if Config.ARCHIVE_INTERVAL_HOURS and app.job_queue:
+        interval = Config.ARCHIVE_INTERVAL_HOURS * 3600
+        app.job_queue.run_repeating(archive_job, interval=interval, first=interval)
+    if Config.STATS_SNAPSHOT_SECONDS and app.job_queue:
+        interval = Config.STATS_SNAPSHOT_SECONDS
+        app.job_queue.run_repeating(stats_snapshot_job, interval=interval, first=interval)
+    if Config.STATS_RECONCILE_MINUTES and app.job_queue:
+        interval = Config.STATS_RECONCILE_MINUTES * 60
+        app.job_queue.run_repeating(stats_reconcile_job, interval=interval, first=interval)
+    return app
+
+# 🚀 Запуск бота
+async def run_admin_bot(token: str):
+    # run_polling() сам создаёт event loop, а боты работают в общем (main.py)
+    app = build_admin_app(token)
+    async with app:
+        await app.start()
+        await app.updater.start_polling()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await app.updater.stop()
+            await app.stop()
+            # Закрываем журнал трафика, иначе gzip останется без конца потока
+            recorder = get_recorder(Config.TRAFFIC_CAPTURE_PATH)
+            if recorder:
+                recorder.close()
 async def show_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         rows = sheet.get_all_values()[1:]  # Пропускаем заголовки
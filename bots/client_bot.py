@@ -3,15 +3,19 @@
 
 ▌ Функционал:
 - Главное меню: Заявка, Частые вопросы, Контакты, О нас
-- Заявка: пошаговый ввод геолокации или адреса → телефона
+- Заявка: пошаговый ввод геолокации или адреса → телефона (заявка записывается) →
+  документов/фото (необязательно, дописываются в колонку F)
 - Интеграция с Google Sheets (append_to_sheet)
+- Адрес по геолокации определяется в фоне (services.geocoding)
 
 """
 
+import asyncio
 import logging
+import re
 from datetime import datetime
 import pytz
-from typing import Dict, Any
+from typing import Optional
 
 from telegram import (
     Update,
@@ -25,13 +29,19 @@ from telegram.ext import (
     MessageHandler,
     ConversationHandler,
     ContextTypes,
+    TypeHandler,
     filters,
 )
+from telegram.request import BaseRequest
 
-from services.gsheets import append_to_sheet
+from config import Config
+from services.attachments import attachment_store, AttachmentError
+from services.geocoding import reverse_geocoder
+from services.gsheets import append_to_sheet, gs_service, update_files
+from services.traffic import get_recorder
 
 # 📌 Константы состояний диалога
-CHOOSING, LOCATION, PHONE = range(3)
+CHOOSING, LOCATION, PHONE, ATTACHMENTS = range(4)
 
 # ⏰ Временная зона
 TIMEZONE = pytz.timezone("Europe/Moscow")
@@ -42,6 +52,18 @@ main_keyboard = ReplyKeyboardMarkup([
     ["❓ Частые вопросы", "📞 Контакты", "ℹ️ О нас"]
 ], resize_keyboard=True)
 
+# 🔘 Тексты кнопок (не обезличиваются при записи трафика)
+MENU_BUTTONS = {
+    "📨 Отправить заявку", "❓ Частые вопросы", "📞 Контакты", "ℹ️ О нас",
+    "📍 Отправить геолокацию", "🏠 Ввести адрес вручную", "🔙 Главное меню",
+    "✅ Готово", "⏭ Пропустить",
+}
+
+# 🔘 Кнопки меню, которые выводят из диалога заявки на любом шаге
+MENU_FILTER = filters.Regex("❓ Частые вопросы|📞 Контакты|ℹ️ О нас|🔙 Главное меню")
+
+logger = logging.getLogger(__name__)
+
 # 🚀 Старт
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
@@ -51,8 +73,45 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return CHOOSING
 
+# ❓ Частые вопросы
+async def faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(
+        "❓ <b>Частые вопросы</b>\n\n"
+        "<b>Что нужно для заявки?</b>\nАдрес или геолокация объекта и номер телефона. "
+        "Документы на участок можно приложить сразу — это ускорит работу.\n\n"
+        "<b>Когда со мной свяжутся?</b>\nСпециалист перезвонит в рабочее время в течение дня.",
+        parse_mode="HTML",
+        reply_markup=main_keyboard
+    )
+
+# 📞 Контакты
+async def contacts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(
+        "📞 Оставьте заявку через «📨 Отправить заявку» — специалист свяжется с вами по указанному номеру.",
+        reply_markup=main_keyboard
+    )
+
+# ℹ️ О нас
+async def about(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(
+        "ℹ️ Мы выполняем геодезические работы, межевание и кадастровый учёт.",
+        reply_markup=main_keyboard
+    )
+
+# ❌ Отмена заявки
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    for task in context.user_data.get("attachment_tasks", []):
+        task.cancel()
+    # На шаге документов заявка уже записана, отменяется только приём файлов
+    text = "Приём документов отменён." if "request_id" in context.user_data else "Заявка отменена."
+    context.user_data.clear()
+    await update.message.reply_text(text, reply_markup=main_keyboard)
+    return ConversationHandler.END
+
 # 📨 Отправка заявки: выбор геолокации или адреса
 async def send_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Повторный вход из шага документов: файлы прошлой заявки дописываются в фоне
+    _attach_in_background(update, context)
     keyboard = [
         [KeyboardButton("📍 Отправить геолокацию", request_location=True)],
         [KeyboardButton("🏠 Ввести адрес вручную")]
@@ -69,15 +128,17 @@ async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
         lat = update.message.location.latitude
         lon = update.message.location.longitude
         context.user_data["address"] = f"Геолокация: {lat}, {lon}"
+        context.user_data["location"] = (lat, lon)
     else:
         context.user_data["address"] = update.message.text.strip()
+        context.user_data.pop("location", None)
     await update.message.reply_text(
         "Теперь отправьте ваш номер телефона:",
         reply_markup=ReplyKeyboardRemove()
     )
     return PHONE
 
-# ☎️ Обработка телефона и отправка заявки
+# ☎️ Обработка телефона
 async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     phone = update.message.text.strip()
     # Проверка формата телефона (пример: +7 999 123 45 67)
@@ -89,39 +150,196 @@ async def handle_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     address = context.user_data.get("address", "Не указано")
     timestamp = datetime.now(TIMEZONE).strftime("%Y-%m-%d %H:%M:%S")
 
-    append_to_sheet([
-        "",  # Пустой ID (заполняется автоматически в Google Sheets)
+    # Заявка записывается сразу, документы дописываются в колонку F позже
+    request_id = gs_service.next_request_id()
+    row_index = append_to_sheet([
+        request_id,
         address,
         phone,
         timestamp,
-        "Новая"
+        "Новая",
+        ""  # Файлы
     ])
+    if row_index is None:
+        await update.message.reply_text("❌ Не удалось отправить заявку, попробуйте ещё раз.", reply_markup=main_keyboard)
+        return ConversationHandler.END
 
+    location = context.user_data.pop("location", None)
+    if location:
+        reverse_geocoder.submit(row_index, *location, address)
+
+    context.user_data["request_id"] = request_id
+    context.user_data["attachment_tasks"] = []
     await update.message.reply_text(
-        "✅ Ваша заявка отправлена!\nНаш специалист свяжется с вами в ближайшее время.",
-        reply_markup=ReplyKeyboardMarkup([["📞 Контакты", "🔙 Главное меню"]], resize_keyboard=True)
+        "✅ Ваша заявка отправлена!\nНаш специалист свяжется с вами в ближайшее время.\n\n"
+        "Если есть документы на участок или план — отправьте их фото или файлы (PDF, JPG, PNG).\n"
+        "Когда закончите, нажмите «✅ Готово», или «⏭ Пропустить», если документов нет.",
+        reply_markup=ReplyKeyboardMarkup([["✅ Готово", "⏭ Пропустить"]], resize_keyboard=True)
     )
+    return ATTACHMENTS
+
+# 📎 Приём документов и фото
+async def handle_attachment(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    tasks = context.user_data.setdefault("attachment_tasks", [])
+    if len(tasks) >= Config.ATTACHMENT_MAX_FILES:
+        await update.message.reply_text(f"⚠️ Можно приложить не больше {Config.ATTACHMENT_MAX_FILES} файлов.")
+        return ATTACHMENTS
+
+    if update.message.photo:
+        attachment, mime_type = update.message.photo[-1], "image/jpeg"
+    else:
+        attachment, mime_type = update.message.document, update.message.document.mime_type
+
+    try:
+        attachment_store.check(attachment.file_size, mime_type)
+    except AttachmentError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return ATTACHMENTS
+
+    # Загрузка идёт в фоне, чтобы большие файлы не задерживали других пользователей
+    tasks.append(context.application.create_task(
+        _download_attachment(update, context, attachment, mime_type)
+    ))
+    return ATTACHMENTS
+
+async def _download_attachment(update: Update, context: ContextTypes.DEFAULT_TYPE, attachment, mime_type: str):
+    try:
+        telegram_file = await context.bot.get_file(attachment.file_id)
+        stored = await attachment_store.download(telegram_file.file_path, mime_type, attachment.file_size)
+    except AttachmentError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return None
+    except Exception:
+        logger.exception("Ошибка при получении файла")
+        await update.message.reply_text("❌ Не удалось загрузить файл, попробуйте ещё раз.")
+        return None
+    await update.message.reply_text("📎 Файл получен.")
+    return stored
+
+# ✅ Завершение шага с документами
+async def finish_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    done_keyboard = ReplyKeyboardMarkup([["📞 Контакты", "🔙 Главное меню"]], resize_keyboard=True)
+    if _attach_in_background(update, context):
+        await update.message.reply_text("⏳ Дожидаюсь загрузки файлов...", reply_markup=done_keyboard)
+    else:
+        await update.message.reply_text("👌 Спасибо! Ждите звонка специалиста.", reply_markup=done_keyboard)
     return ConversationHandler.END
 
-# 🚀 Запуск бота
-async def run_client_bot():
-    from config import TELEGRAM_CLIENT_TOKEN
+def _attach_in_background(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """
+    Забирает из user_data загрузки текущей заявки и дописывает файлы в фоне
+
+    Returns:
+        bool: Есть ли ещё не завершённые загрузки
+    """
+    tasks = context.user_data.pop("attachment_tasks", [])
+    request_id = context.user_data.pop("request_id", None)
+    if not tasks:
+        return False
+    # Ссылки на файлы дописываются в фоне, заявка в таблице уже есть
+    context.application.create_task(_attach_files(update, request_id, tasks))
+    return any(not task.done() for task in tasks)
+
+# 🔚 Выход из диалога через меню или /start
+def _leave_conversation(callback):
+    """Обработчик меню внутри диалога: выполняет callback и завершает диалог"""
+    async def handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        _attach_in_background(update, context)
+        await callback(update, context)
+        return ConversationHandler.END
+    return handler
 
-    app = Application.builder().token(TELEGRAM_CLIENT_TOKEN).build()
+# ⏰ Диалог брошен: файлы, присланные без «Готово», всё равно попадают в заявку
+async def conversation_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _attach_in_background(update, context)
 
+async def _attach_files(update: Update, request_id: Optional[str], tasks: list):
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=Config.ATTACHMENT_WAIT_SECONDS)
+        if pending:
+            logger.warning(f"Не дождались загрузки файлов: {len(pending)}")
+            for task in pending:
+                task.cancel()
+        files = [task.result() for task in done if not task.cancelled() and not task.exception() and task.result()]
+        if not files:
+            return
+
+        names = ", ".join(dict.fromkeys(stored.name for stored in files))
+        loop = asyncio.get_running_loop()
+        if not request_id or not await loop.run_in_executor(None, update_files, request_id, names):
+            raise RuntimeError(f"Файлы не записаны в заявку {request_id}")
+    except Exception:
+        logger.exception("Ошибка при добавлении файлов к заявке")
+        await update.message.reply_text("❌ Не удалось приложить файлы к заявке.")
+        return
+
+    await update.message.reply_text(f"📎 К заявке приложено файлов: {len(files)}")
+
+# 📎 Подсказка на шаге вложений
+async def attachments_hint(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("Отправьте фото или файл документа, либо нажмите «✅ Готово» / «⏭ Пропустить».")
+    return ATTACHMENTS
+
+# 🏗 Сборка приложения
+def build_client_app(token: str, request: Optional[BaseRequest] = None) -> Application:
+    builder = Application.builder().token(token)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    app = builder.build()
+
+    recorder = get_recorder(Config.TRAFFIC_CAPTURE_PATH)
+    if recorder:
+        app.add_handler(recorder.handler("client", keep_texts=MENU_BUTTONS), group=-1)
+
+    text = filters.TEXT & ~filters.COMMAND & ~MENU_FILTER
     conv_handler = ConversationHandler(
         entry_points=[MessageHandler(filters.Regex("📨 Отправить заявку"), send_request)],
         states={
-            LOCATION: [MessageHandler(filters.LOCATION | filters.TEXT & ~filters.COMMAND, handle_location)],
-            PHONE: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_phone)],
+            LOCATION: [MessageHandler(filters.LOCATION | text, handle_location)],
+            PHONE: [MessageHandler(text, handle_phone)],
+            ATTACHMENTS: [
+                MessageHandler(filters.PHOTO | filters.Document.ALL, handle_attachment),
+                MessageHandler(filters.Regex("^(✅ Готово|⏭ Пропустить)$"), finish_request),
+                MessageHandler(text, attachments_hint),
+            ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timeout)],
         },
-        fallbacks=[CommandHandler("cancel", cancel)],
+        fallbacks=[
+            CommandHandler("cancel", cancel),
+            CommandHandler("start", _leave_conversation(start)),
+            MessageHandler(filters.Regex("❓ Частые вопросы"), _leave_conversation(faq)),
+            MessageHandler(filters.Regex("📞 Контакты"), _leave_conversation(contacts)),
+            MessageHandler(filters.Regex("ℹ️ О нас"), _leave_conversation(about)),
+            MessageHandler(filters.Regex("🔙 Главное меню"), _leave_conversation(start)),
+        ],
+        allow_reentry=True,
+        conversation_timeout=Config.CONVERSATION_TIMEOUT_SECONDS or None,
     )
 
-    app.add_handler(CommandHandler("start", start))
+    # Диалог первым: внутри него меню и /start обрабатываются его fallbacks
     app.add_handler(conv_handler)
+    app.add_handler(CommandHandler("start", start))
     app.add_handler(MessageHandler(filters.Regex("❓ Частые вопросы"), faq))
     app.add_handler(MessageHandler(filters.Regex("📞 Контакты"), contacts))
     app.add_handler(MessageHandler(filters.Regex("ℹ️ О нас"), about))
+    app.add_handler(MessageHandler(filters.Regex("🔙 Главное меню"), start))
+    return app
 
-    await app.run_polling()
\ No newline at end of file
+# 🚀 Запуск бота
+async def run_client_bot(token: str):
+    # run_polling() сам создаёт event loop, а боты работают в общем (main.py)
+    app = build_client_app(token)
+    async with app:
+        await app.start()
+        await app.updater.start_polling()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await app.updater.stop()
+            await app.stop()
+            # Дообрабатываем очередь геокодирования, иначе последние заявки останутся без адреса
+            await reverse_geocoder.close()
+            # Закрываем журнал трафика, иначе gzip останется без конца потока
+            recorder = get_recorder(Config.TRAFFIC_CAPTURE_PATH)
+            if recorder:
+                recorder.close()
\ No newline at end of file
@@ -25,4 +25,43 @@ class Config:
     ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID')        # Chat ID администратора в Telegram
     
     # Настройки кэширования
-    CACHE_EXPIRY_MINUTES = int(os.getenv('CACHE_EXPIRY_MINUTES', 5))  # Время жизни кэша в минутах
\ No newline at end of file
+    CACHE_EXPIRY_MINUTES = int(os.getenv('CACHE_EXPIRY_MINUTES', 5))  # Время жизни кэша в минутах
+    
+    # Настройки профилирования
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')  # Папка для сохранения профилей
+    PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', 300))  # Максимальная длительность захвата
+    PROFILE_SAMPLE_INTERVAL_MS = int(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', 5))  # Интервал семплирования стека
+    SLOW_CALLBACK_MS = int(os.getenv('SLOW_CALLBACK_MS', 100))  # Порог медленного callback в event loop
+    SLOW_CALLBACK_MONITOR = os.getenv('SLOW_CALLBACK_MONITOR', '1') == '1'  # Постоянный сторож event loop (1/0)
+
+    
+    # Настройки записи трафика (пустое значение — запись выключена)
+    TRAFFIC_CAPTURE_PATH = os.getenv('TRAFFIC_CAPTURE_PATH', '')  # Путь к журналу (.jsonl или .jsonl.gz)
+    
+    # Настройки статистики
+    STATS_SNAPSHOT_PATH = os.getenv('STATS_SNAPSHOT_PATH', 'data/stats.json')  # Снимок статистики
+    STATS_SNAPSHOT_SECONDS = int(os.getenv('STATS_SNAPSHOT_SECONDS', 60))  # Интервал сохранения снимка
+    STATS_RECONCILE_MINUTES = int(os.getenv('STATS_RECONCILE_MINUTES', 10))  # Сверка статусов с таблицей (0 — выключена)
+    
+    # Настройки архивации
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 90))  # Архивировать завершённые заявки, созданные более N дней назад
+    ARCHIVE_PERIOD = os.getenv('ARCHIVE_PERIOD', 'month')  # Разбиение архива: month или year
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 500))  # Максимум строк за один запуск
+    ARCHIVE_INTERVAL_HOURS = int(os.getenv('ARCHIVE_INTERVAL_HOURS', 24))  # Интервал автоархивации (0 — выключена)
+    SHARD_MAP_PATH = os.getenv('SHARD_MAP_PATH', 'data/shards.json')  # Карта архивных листов
+    
+    # Настройки обратного геокодирования
+    GEOCODER_PROVIDER = os.getenv('GEOCODER_PROVIDER', 'nominatim')  # nominatim или none
+    NOMINATIM_URL = os.getenv('NOMINATIM_URL', 'https://nominatim.openstreetmap.org')  # Адрес сервиса Nominatim
+    GEOCODER_USER_AGENT = os.getenv('GEOCODER_USER_AGENT', 'cadastr-bot')  # User-Agent для запросов
+    GEOCODER_CACHE_PATH = os.getenv('GEOCODER_CACHE_PATH', 'data/geocode_cache.json')  # Кэш адресов
+    GEOCODER_CACHE_SIZE = int(os.getenv('GEOCODER_CACHE_SIZE', 10000))  # Размер LRU-кэша
+    
+    # Настройки вложений к заявкам
+    ATTACHMENT_DIR = os.getenv('ATTACHMENT_DIR', 'data/attachments')  # Папка хранилища файлов
+    ATTACHMENT_MAX_MB = int(os.getenv('ATTACHMENT_MAX_MB', 20))  # Максимальный размер файла (лимит Bot API — 20 МБ)
+    ATTACHMENT_MAX_FILES = int(os.getenv('ATTACHMENT_MAX_FILES', 10))  # Максимум файлов в одной заявке
+    ATTACHMENT_MAX_CONCURRENT = int(os.getenv('ATTACHMENT_MAX_CONCURRENT', 3))  # Одновременных загрузок
+    CONVERSATION_TIMEOUT_SECONDS = int(os.getenv('CONVERSATION_TIMEOUT_SECONDS', 900))  # Сброс брошенного диалога заявки (0 — выключен)
+    ATTACHMENT_WAIT_SECONDS = int(os.getenv('ATTACHMENT_WAIT_SECONDS', 300))  # Ожидание загрузок после «Готово»
+    ATTACHMENT_TYPES = os.getenv('ATTACHMENT_TYPES', 'application/pdf,image/jpeg,image/png,image/tiff,image/heic')  # Допустимые MIME-типы
\ No newline at end of file
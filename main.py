@@ -108,6 +108,13 @@ async def run_bot_safely(bot_runner, token: str, name: str) -> None:
 async def run_all_bots(config: BotConfig) -> None:
     """Запускает всех ботов параллельно"""
     from bots import run_client_bot, run_admin_bot
+    from config import Config
+    from services.profiler import profiler_service
+    from services.stats import request_stats
+    
+    # Сторож event loop общий для обоих ботов
+    if Config.SLOW_CALLBACK_MONITOR:
+        profiler_service.monitor.start()
     
     tasks = [
         asyncio.create_task(run_bot_safely(run_client_bot, config.get('client'), "Клиентский бот")),
@@ -121,6 +128,9 @@ async def run_all_bots(config: BotConfig) -> None:
         for task in tasks:
             task.cancel()
         raise
+    finally:
+        # Статистику пишут оба бота, последний снимок сохраняем при любом завершении
+        request_stats.save()
 
 # ====================
 # 🏁 ТОЧКА ВХОДА
@@ -0,0 +1,334 @@
+"""
+🔁 ВОСПРОИЗВЕДЕНИЕ ЗАПИСАННОГО ТРАФИКА
+
+▌ Назначение:
+  Прогоняет журнал, записанный при TRAFFIC_CAPTURE_PATH, через приложения
+  клиентского бота и админ-панели с ускорением 1×–100×, чтобы заранее
+  отрепетировать пиковые дни.
+
+▌ Особенности:
+  ✔ Локальная заглушка Telegram Bot API (без сети)
+  ✔ Локальная заглушка Google Sheets с настраиваемой задержкой
+  ✔ Отчёт по задержкам обработки и очереди во времени
+
+▌ Запуск:
+  python replay.py traffic.jsonl.gz --speed 20 --sheets-latency 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+from telegram.request import BaseRequest, RequestData
+
+from config import Config
+from services.traffic import read_traffic
+
+logger = logging.getLogger("replay")
+
+MIN_SPEED, MAX_SPEED = 1.0, 100.0
+
+
+# ====================
+# 🧪 ЛОКАЛЬНЫЕ ЗАГЛУШКИ
+# ====================
+
+class LocalBotRequest(BaseRequest):
+    """Заглушка Bot API: отвечает успехом на любой метод без обращения к сети"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._message_id = 0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        self._message_id += 1
+        return {
+            'message_id': params.get('message_id') or self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id') or 0), 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         **kwargs) -> Tuple[int, bytes]:
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if endpoint == 'getMe':
+            result: Any = {'id': 1, 'is_bot': True, 'first_name': 'Replay', 'username': 'replay_bot'}
+        elif endpoint in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup'):
+            result = self._message(params)
+        elif endpoint == 'getUpdates':
+            result = []
+        elif endpoint == 'getFile':
+            result = {'file_id': params.get('file_id'), 'file_unique_id': 'replay', 'file_path': 'replay/file'}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+
+async def local_file_stream(url: str, client: Any = None):
+    """Заглушка скачивания вложений: 256 КБ данных без сети"""
+    for _ in range(4):
+        yield b"\0" * 64 * 1024
+
+
+class InMemoryWorksheet:
+    """Заглушка листа gspread с блокирующей задержкой, как у настоящего API"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.rows: List[List[Any]] = [["ID", "Адрес", "Телефон", "Дата", "Статус", "Файлы"]]
+
+    def append_row(self, values: list, value_input_option: str = None, **kwargs):
+        time.sleep(self.latency)
+        self.rows.append(list(values))
+        row = len(self.rows)
+        return {'updates': {'updatedRange': f"'Лист1'!A{row}:F{row}"}}
+
+    def update_cell(self, row: int, col: int, value: Any):
+        time.sleep(self.latency)
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = value
+
+    def get_all_values(self) -> List[List[Any]]:
+        time.sleep(self.latency)
+        return [list(row) for row in self.rows]
+
+    def col_values(self, col: int) -> List[Any]:
+        time.sleep(self.latency)
+        return [row[col - 1] if col <= len(row) else "" for row in self.rows]
+
+    def cell(self, row: int, col: int):
+        time.sleep(self.latency)
+        cells = self.rows[row - 1] if row <= len(self.rows) else []
+        return SimpleNamespace(row=row, col=col, value=cells[col - 1] if col <= len(cells) else None)
+
+    def find(self, query: str, in_row: int = None, in_column: int = None):
+        time.sleep(self.latency)
+        for index, row in enumerate(self.rows, start=1):
+            cells = row if in_column is None else row[in_column - 1:in_column]
+            if query in (str(value) for value in cells):
+                return SimpleNamespace(row=index, col=in_column or 1, value=query)
+        return None
+
+    def row_values(self, row: int) -> List[Any]:
+        time.sleep(self.latency)
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+
+# ====================
+# ⏱ ИЗМЕРЕНИЯ
+# ====================
+
+class ReplayMetrics:
+    """Время постановки в очередь, начала и окончания обработки каждого обновления"""
+
+    def __init__(self):
+        self.enqueued: Dict[Tuple[str, int], float] = {}
+        self.started: Dict[Tuple[str, int], float] = {}
+        self.finished: Dict[Tuple[str, int], float] = {}
+        self.timeline: List[Dict[str, Any]] = []
+
+    def handlers(self, bot: str) -> Tuple[TypeHandler, TypeHandler]:
+        """Обработчики для первой и последней группы приложения"""
+        async def on_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            self.started.setdefault((bot, update.update_id), time.perf_counter())
+
+        async def on_finish(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            self.finished[(bot, update.update_id)] = time.perf_counter()
+
+        return TypeHandler(Update, on_start), TypeHandler(Update, on_finish)
+
+    @staticmethod
+    def _percentile(values: List[float], q: float) -> float:
+        if not values:
+            return 0.0
+        values = sorted(values)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def summary(self) -> Dict[str, Any]:
+        result = {}
+        for bot in sorted({key[0] for key in self.enqueued}):
+            keys = [key for key in self.enqueued if key[0] == bot]
+            done = [key for key in keys if key in self.finished]
+            latency = [self.finished[key] - self.enqueued[key] for key in done]
+            wait = [self.started[key] - self.enqueued[key] for key in done if key in self.started]
+            result[bot] = {
+                'updates': len(keys),
+                'processed': len(done),
+                'latency_p50': self._percentile(latency, 0.50),
+                'latency_p95': self._percentile(latency, 0.95),
+                'latency_p99': self._percentile(latency, 0.99),
+                'latency_max': max(latency, default=0.0),
+                'queue_wait_p95': self._percentile(wait, 0.95),
+            }
+        return result
+
+
+# ====================
+# 🔁 ВОСПРОИЗВЕДЕНИЕ
+# ====================
+
+def build_apps(bots: List[str], api_latency: float) -> Dict[str, Application]:
+    """Собирает приложения ботов поверх локальной заглушки Bot API"""
+    from bots.client_bot import build_client_app
+    from bots.admin_bot import build_admin_app
+
+    builders = {'client': build_client_app, 'admin': build_admin_app}
+    return {
+        bot: builders[bot]("0:replay", request=LocalBotRequest(api_latency))
+        for bot in bots
+    }
+
+
+async def _sample_timeline(apps: Dict[str, Application], metrics: ReplayMetrics,
+                           started: float, interval: float):
+    while True:
+        point: Dict[str, Any] = {'t': round(time.perf_counter() - started, 2)}
+        for bot, app in apps.items():
+            enqueued = sum(1 for key in metrics.enqueued if key[0] == bot)
+            finished = sum(1 for key in metrics.finished if key[0] == bot)
+            point[bot] = {'queue': app.update_queue.qsize(), 'backlog': enqueued - finished}
+        metrics.timeline.append(point)
+        await asyncio.sleep(interval)
+
+
+async def replay(path: str, speed: float, api_latency: float, sheets_latency: float,
+                 sample_interval: float, drain_timeout: float) -> ReplayMetrics:
+    """Воспроизводит журнал с ускорением speed и возвращает метрики"""
+    events = sorted(read_traffic(path), key=lambda event: event['t'])
+    if not events:
+        raise ValueError(f"Журнал пуст: {path}")
+
+    # Запись трафика во время воспроизведения не нужна
+    Config.TRAFFIC_CAPTURE_PATH = ''
+
+    from services import attachments, gsheets, geocoding
+    from services.archive import ShardMap
+    gsheets.gs_service.worksheet = InMemoryWorksheet(sheets_latency)
+    gsheets.gs_service.shard_map = ShardMap()
+    geocoding.reverse_geocoder.provider = geocoding.StaticProvider(default="Адрес (заглушка)")
+    geocoding.reverse_geocoder.cache = geocoding.PersistentLRUCache()
+    attachments.attachment_store.stream = local_file_stream
+    attachments.attachment_store.root = tempfile.mkdtemp(prefix="replay_attachments_")
+
+    apps = build_apps(sorted({event['bot'] for event in events}), api_latency)
+    metrics = ReplayMetrics()
+    for bot, app in apps.items():
+        first, last = metrics.handlers(bot)
+        app.add_handler(first, group=-100)
+        app.add_handler(last, group=100)
+
+    for app in apps.values():
+        await app.initialize()
+        await app.start()
+
+    origin = events[0]['t']
+    started = time.perf_counter()
+    sampler = asyncio.create_task(_sample_timeline(apps, metrics, started, sample_interval))
+    logger.info(f"Воспроизведение {len(events)} обновлений с ускорением {speed}×")
+
+    try:
+        for event in events:
+            delay = (event['t'] - origin) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            app = apps[event['bot']]
+            update = Update.de_json(event['update'], app.bot)
+            metrics.enqueued[(event['bot'], update.update_id)] = time.perf_counter()
+            await app.update_queue.put(update)
+
+        deadline = time.perf_counter() + drain_timeout
+        while len(metrics.finished) < len(metrics.enqueued) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+    finally:
+        sampler.cancel()
+        for app in apps.values():
+            await app.stop()
+            await app.shutdown()
+        await geocoding.reverse_geocoder.close()
+
+    return metrics
+
+
+def print_report(metrics: ReplayMetrics):
+    print("=" * 60)
+    for bot, stats in metrics.summary().items():
+        print(f"{bot}: обработано {stats['processed']}/{stats['updates']}")
+        print(f"  задержка p50={stats['latency_p50']:.3f}s p95={stats['latency_p95']:.3f}s "
+              f"p99={stats['latency_p99']:.3f}s max={stats['latency_max']:.3f}s")
+        print(f"  ожидание в очереди p95={stats['queue_wait_p95']:.3f}s")
+    print("-" * 60)
+    print("Очередь во времени (t: бот=очередь/в обработке):")
+    for point in metrics.timeline:
+        bots = " ".join(
+            f"{bot}={value['queue']}/{value['backlog']}"
+            for bot, value in point.items() if bot != 't'
+        )
+        print(f"  {point['t']:>8.2f}s  {bots}")
+    print("=" * 60)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Воспроизведение записанного трафика ботов")
+    parser.add_argument('path', help="Журнал трафика (.jsonl или .jsonl.gz)")
+    parser.add_argument('--speed', type=float, default=1.0, help="Ускорение, от 1 до 100")
+    parser.add_argument('--api-latency', type=float, default=0.05, help="Задержка заглушки Bot API, с")
+    parser.add_argument('--sheets-latency', type=float, default=0.3, help="Задержка заглушки Sheets, с")
+    parser.add_argument('--sample-interval', type=float, default=1.0, help="Шаг отчёта по очереди, с")
+    parser.add_argument('--drain-timeout', type=float, default=60.0, help="Ожидание обработки хвоста, с")
+    parser.add_argument('--output', help="Сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    if not MIN_SPEED <= args.speed <= MAX_SPEED:
+        parser.error(f"--speed должен быть от {MIN_SPEED:g} до {MAX_SPEED:g}")
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.WARNING
+    )
+    logger.setLevel(logging.INFO)
+
+    metrics = asyncio.run(replay(
+        args.path, args.speed, args.api_latency, args.sheets_latency,
+        args.sample_interval, args.drain_timeout
+    ))
+    print_report(metrics)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'summary': metrics.summary(), 'timeline': metrics.timeline}, f,
+                      ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
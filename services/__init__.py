@@ -8,20 +8,23 @@
 Содержит:
 - GoogleSheetsService - основной класс для работы с таблицами
 - append_to_sheet - функция быстрой записи в таблицу
-- get_worksheet - функция получения листа таблицы
+- update_status - функция смены статуса заявки
+- gs_service - общий экземпляр GoogleSheetsService
 """
 
 from .gsheets import (
     GoogleSheetsService,  # Основной сервисный класс
     append_to_sheet,      # Упрощенный интерфейс для добавления данных
-    get_worksheet         # Упрощенный интерфейс для получения листа
+    update_status,        # Упрощенный интерфейс для смены статуса
+    gs_service            # Общий экземпляр сервиса
 )
 
 # Определяем публичный API модуля
 __all__ = [
     'GoogleSheetsService',
-    'append_to_sheet', 
-    'get_worksheet'
+    'append_to_sheet',
+    'update_status',
+    'gs_service'
 ]
 
 # Инициализация логгера
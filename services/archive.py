@@ -0,0 +1,234 @@
+"""
+Модуль архивации и шардирования заявок
+
+Переносит завершённые заявки, созданные раньше порога (по дате в колонке D;
+время завершения в таблице не хранится), из рабочего листа в архивные
+листы той же таблицы (по месяцам или годам), чтобы рабочий лист оставался
+небольшим и append_row/поиск по нему работали быстро.
+
+Карта шардов хранит для каждого архивного листа диапазон ID и дат и
+позволяет направлять чтения только в нужные листы.
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.stats import STATUS_DONE, TIMEZONE, parse_sheet_time
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "Архив"
+
+# Колонки листа заявок; в старых таблицах колонки «Файлы» может не быть
+COLUMNS = ["ID", "Адрес", "Телефон", "Дата", "Статус", "Файлы"]
+
+
+def _numeric_id(value: Any) -> Optional[int]:
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+class ShardMap:
+    """Карта архивных листов: диапазоны ID и дат для маршрутизации чтений"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path (str): Путь к JSON-файлу карты (None — только в памяти)
+        """
+        self.path = path
+        self.shards: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.shards = json.load(f).get('shards', {})
+        except (OSError, ValueError):
+            logger.exception("Ошибка загрузки карты шардов")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps({'shards': self.shards}, ensure_ascii=False, indent=1)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def register(self, title: str, rows: List[List[Any]], added: Optional[int] = None):
+        """
+        Расширяет диапазоны шарда строками, перенесёнными в него
+
+        Args:
+            title (str): Архивный лист
+            rows: Строки, находящиеся в листе (в том числе записанные прошлой попыткой)
+            added (int): Сколько из них добавлено сейчас (по умолчанию все)
+        """
+        with self._lock:
+            shard = self.shards.setdefault(title, {
+                'min_id': None, 'max_id': None, 'date_from': None, 'date_to': None, 'rows': 0
+            })
+            for row in rows:
+                row_id = _numeric_id(row[0])
+                if row_id is not None:
+                    shard['min_id'] = row_id if shard['min_id'] is None else min(shard['min_id'], row_id)
+                    shard['max_id'] = row_id if shard['max_id'] is None else max(shard['max_id'], row_id)
+                day = parse_sheet_time(row[3]).strftime("%Y-%m-%d")
+                shard['date_from'] = day if shard['date_from'] is None else min(shard['date_from'], day)
+                shard['date_to'] = day if shard['date_to'] is None else max(shard['date_to'], day)
+            shard['rows'] += len(rows) if added is None else added
+
+    def shards_for_id(self, row_id: Any) -> List[str]:
+        """Архивные листы, в которых может находиться заявка с данным ID"""
+        numeric = _numeric_id(row_id)
+        with self._lock:
+            if numeric is None:
+                return sorted(self.shards, reverse=True)
+            return [
+                title for title, shard in sorted(self.shards.items(), reverse=True)
+                if shard['min_id'] is None or shard['min_id'] <= numeric <= shard['max_id']
+            ]
+
+    def shards_for_dates(self, date_from: str, date_to: str) -> List[str]:
+        """Архивные листы, пересекающиеся с интервалом дат (YYYY-MM-DD)"""
+        with self._lock:
+            return [
+                title for title, shard in sorted(self.shards.items())
+                if shard['date_from'] is not None and shard['date_to'] is not None
+                and shard['date_from'] <= date_to and shard['date_to'] >= date_from
+            ]
+
+
+class ArchiveService:
+    """Пакетный перенос завершённых заявок в архивные листы"""
+
+    def __init__(self, sheets_service, shard_map: ShardMap, after_days: int = 90,
+                 period: str = "month", batch_size: int = 500):
+        """
+        Args:
+            sheets_service: Экземпляр GoogleSheetsService
+            shard_map (ShardMap): Карта шардов
+            after_days (int): Архивировать завершённые заявки, созданные раньше, чем столько дней назад
+            period (str): Разбиение архива: "month" или "year"
+            batch_size (int): Максимум строк за один запуск
+        """
+        self.sheets = sheets_service
+        self.shard_map = shard_map
+        self.after_days = after_days
+        self.period = period
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+    def shard_title(self, created: datetime) -> str:
+        if self.period == "year":
+            return f"{ARCHIVE_PREFIX} {created:%Y}"
+        return f"{ARCHIVE_PREFIX} {created:%Y-%m}"
+
+    def _select(self, rows: List[List[Any]], now: datetime) -> List[Tuple[int, List[Any]]]:
+        """Выбирает строки для переноса: (номер строки, значения)"""
+        threshold = now - timedelta(days=self.after_days)
+        selected = []
+        skipped_without_id = 0
+        for index, row in enumerate(rows[1:], start=2):
+            row = list(row) + [""] * (len(COLUMNS) - len(row))
+            if row[4] != STATUS_DONE or parse_sheet_time(row[3]) >= threshold:
+                continue
+            if not str(row[0]).strip():
+                # Без ID заявку нельзя найти после сдвига строк
+                skipped_without_id += 1
+                continue
+            selected.append((index, row))
+            if len(selected) >= self.batch_size:
+                break
+        if skipped_without_id:
+            logger.warning(f"Пропущено строк без ID при архивации: {skipped_without_id}")
+        return selected
+
+    @staticmethod
+    def _ranges(indices: List[int]) -> List[Tuple[int, int]]:
+        """Непрерывные диапазоны номеров строк, от нижних к верхним"""
+        ranges: List[Tuple[int, int]] = []
+        for index in sorted(indices):
+            if ranges and ranges[-1][1] == index - 1:
+                ranges[-1] = (ranges[-1][0], index)
+            else:
+                ranges.append((index, index))
+        return list(reversed(ranges))
+
+    def archive(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Переносит одну пачку завершённых заявок в архив
+
+        Порядок: запись в архивный лист → сохранение карты шардов →
+        удаление из рабочего листа. При сбое между шагами заявка
+        временно есть в обоих листах и находится в рабочем.
+
+        Returns:
+            Dict[str, int]: Число перенесённых строк по архивным листам
+        """
+        if not self._lock.acquire(blocking=False):
+            logger.info("Архивация уже выполняется")
+            return {}
+        try:
+            return self._archive(now or datetime.now(TIMEZONE))
+        finally:
+            self._lock.release()
+
+    def _archive(self, now: datetime) -> Dict[str, int]:
+        live = self.sheets.worksheet
+        rows = live.get_all_values()
+        if len(rows) < 2:
+            return {}
+        header = list(rows[0]) + COLUMNS[len(rows[0]):]
+        selected = self._select(rows, now)
+        if not selected:
+            return {}
+
+        groups: Dict[str, List[List[Any]]] = {}
+        for _, row in selected:
+            groups.setdefault(self.shard_title(parse_sheet_time(row[3])), []).append(row)
+
+        moved: Dict[str, int] = {}
+        for title, group in groups.items():
+            shard = self.sheets.get_or_create_worksheet(title, header)
+            existing = set(shard.col_values(1))
+            new_rows = [row for row in group if str(row[0]) not in existing]
+            if new_rows:
+                shard.append_rows(new_rows, value_input_option="USER_ENTERED")
+            # Вся группа: после сбоя строки могут уже лежать в листе, но не быть в карте
+            self.shard_map.register(title, group, added=len(new_rows))
+            moved[title] = len(group)
+        self.shard_map.save()
+
+        # Колонку ID читаем один раз: строки не должны были сдвинуться с момента чтения
+        column = live.col_values(1)
+        expected = {index: str(row[0]) for index, row in selected}
+        requests = []
+        for start, end in self._ranges(list(expected)):
+            if any(index > len(column) or str(column[index - 1]) != expected[index]
+                   for index in range(start, end + 1)):
+                logger.warning(f"Строки {start}-{end} сдвинулись, удаление пропущено")
+                continue
+            # Диапазоны идут снизу вверх, поэтому удаление не сдвигает следующие
+            requests.append({"deleteDimension": {"range": {
+                "sheetId": live.id, "dimension": "ROWS", "startIndex": start - 1, "endIndex": end
+            }}})
+        if requests:
+            self.sheets.spreadsheet.batch_update({"requests": requests})
+
+        logger.info(f"Архивировано строк: {sum(moved.values())} ({moved})")
+        return moved
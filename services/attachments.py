@@ -0,0 +1,164 @@
+"""
+Модуль приёма документов и фото к заявкам
+
+Файлы скачиваются из Telegram потоково, частями, прямо на диск — целиком
+в памяти они не держатся. Одновременных загрузок не больше заданного
+числа, поэтому большие файлы не мешают остальным пользователям.
+
+Хранилище адресуется содержимым: имя файла — SHA-256, повторная отправка
+того же документа не занимает места.
+"""
+
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+import httpx
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AttachmentError(Exception):
+    """Файл отклонён (размер, тип) или не скачан"""
+
+
+class StoredFile:
+    """Файл в хранилище"""
+
+    def __init__(self, sha256: str, path: str, size: int, mime_type: str, duplicate: bool):
+        self.sha256 = sha256
+        self.path = path
+        self.size = size
+        self.mime_type = mime_type
+        self.duplicate = duplicate
+
+    @property
+    def name(self) -> str:
+        """Имя файла в хранилище для ссылки в таблице"""
+        return os.path.basename(self.path)
+
+
+async def http_stream(url: str, client: httpx.AsyncClient) -> AsyncIterator[bytes]:
+    """Потоковое чтение файла по HTTP"""
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            yield chunk
+
+
+class AttachmentStore:
+    """Хранилище вложений с дедупликацией по хэшу содержимого"""
+
+    def __init__(self, root: str, max_bytes: int, allowed_types: Iterable[str],
+                 max_concurrent: int = 3, stream: Optional[Callable] = None):
+        """
+        Args:
+            root (str): Папка хранилища
+            max_bytes (int): Максимальный размер файла
+            allowed_types: Допустимые MIME-типы
+            max_concurrent (int): Максимум одновременных загрузок
+            stream: Источник данных (url, client) -> AsyncIterator[bytes], по умолчанию HTTP
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.allowed_types = set(allowed_types)
+        self.stream = stream or http_stream
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def check(self, size: Optional[int], mime_type: Optional[str]):
+        """
+        Проверяет ограничения до начала загрузки
+
+        Raises:
+            AttachmentError: Если файл не подходит
+        """
+        if mime_type not in self.allowed_types:
+            raise AttachmentError("Этот тип файла не поддерживается. Отправьте PDF или изображение.")
+        if size is not None and size > self.max_bytes:
+            raise AttachmentError(f"Файл больше {self.max_bytes // (1024 * 1024)} МБ.")
+
+    def _final_path(self, sha256: str, mime_type: str) -> str:
+        extension = mimetypes.guess_extension(mime_type) or ""
+        return os.path.join(self.root, sha256[:2], f"{sha256}{extension}")
+
+    def _existing_path(self, sha256: str) -> Optional[str]:
+        """Уже сохранённый файл с тем же содержимым (расширение могло отличаться)"""
+        directory = os.path.join(self.root, sha256[:2])
+        if not os.path.isdir(directory):
+            return None
+        for name in os.listdir(directory):
+            if name.startswith(sha256):
+                return os.path.join(directory, name)
+        return None
+
+    async def download(self, url: str, mime_type: str, size: Optional[int] = None) -> StoredFile:
+        """
+        Скачивает файл в хранилище, считая хэш на лету
+
+        Raises:
+            AttachmentError: Если файл не подходит или загрузка не удалась
+        """
+        self.check(size, mime_type)
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=120.0))
+
+        loop = asyncio.get_running_loop()
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = None
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            async with self._semaphore:
+                fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+                with os.fdopen(fd, "wb") as f:
+                    async for chunk in self.stream(url, self._client):
+                        written += len(chunk)
+                        if written > self.max_bytes:
+                            raise AttachmentError(f"Файл больше {self.max_bytes // (1024 * 1024)} МБ.")
+                        digest.update(chunk)
+                        await loop.run_in_executor(None, f.write, chunk)
+
+            sha256 = digest.hexdigest()
+            existing_path = self._existing_path(sha256)
+            duplicate = existing_path is not None
+            if duplicate:
+                final_path = existing_path
+                os.remove(tmp_path)
+            else:
+                final_path = self._final_path(sha256, mime_type)
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+            logger.info(f"Вложение сохранено: {final_path} ({written} байт, дубликат: {duplicate})")
+            return StoredFile(sha256, final_path, written, mime_type, duplicate)
+        except AttachmentError:
+            raise
+        except Exception as e:
+            logger.exception("Ошибка загрузки вложения")
+            raise AttachmentError("Не удалось загрузить файл, попробуйте ещё раз.") from e
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# 🎯 Экземпляр для использования
+attachment_store = AttachmentStore(
+    Config.ATTACHMENT_DIR,
+    Config.ATTACHMENT_MAX_MB * 1024 * 1024,
+    [t.strip() for t in Config.ATTACHMENT_TYPES.split(",") if t.strip()],
+    max_concurrent=Config.ATTACHMENT_MAX_CONCURRENT
+)
@@ -0,0 +1,295 @@
+"""
+Модуль обратного геокодирования
+
+Преобразует координаты из геолокации клиента в адрес вне пути обработки
+запроса: заявки ставятся в очередь, фоновый обработчик собирает их в
+пачки, берёт адреса из постоянного LRU-кэша (ключ — округлённые
+координаты), недостающие запрашивает у провайдера и обновляет строку
+заявки в таблице.
+
+Провайдеры:
+- NominatimProvider - OpenStreetMap Nominatim (не более 1 запроса в секунду)
+- StaticProvider - локальная заглушка для тестов и воспроизведения трафика
+"""
+
+import abc
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import Config
+from services.gsheets import update_address
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[float, float]
+
+# Значение кэша для координат, по которым провайдер адреса не нашёл
+NOT_FOUND = ""
+
+
+class GeocodingProvider(abc.ABC):
+    """Базовый провайдер обратного геокодирования"""
+
+    @abc.abstractmethod
+    def reverse(self, lat: float, lon: float) -> Optional[str]:
+        """Адрес по координатам или None, если адрес не найден"""
+
+    def reverse_batch(self, keys: List[Key]) -> Dict[Key, Optional[str]]:
+        """
+        Адреса для пачки координат (по умолчанию — последовательно)
+
+        Координаты, на которых провайдер упал, в результат не попадают,
+        чтобы их запросили снова, а не закэшировали как ненайденные.
+        """
+        results = {}
+        for lat, lon in keys:
+            try:
+                results[(lat, lon)] = self.reverse(lat, lon)
+            except Exception:
+                logger.exception(f"Ошибка геокодирования {lat}, {lon}")
+        return results
+
+
+class NominatimProvider(GeocodingProvider):
+    """Провайдер OpenStreetMap Nominatim"""
+
+    def __init__(self, url: str, user_agent: str, min_interval: float = 1.0, timeout: float = 10.0):
+        """
+        Args:
+            url (str): Базовый URL сервиса
+            user_agent (str): User-Agent (обязателен по правилам Nominatim)
+            min_interval (float): Минимальный интервал между запросами, с
+            timeout (float): Таймаут запроса, с
+        """
+        self.url = url.rstrip('/')
+        self.user_agent = user_agent
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self._last_request = 0.0
+
+    def reverse(self, lat: float, lon: float) -> Optional[str]:
+        wait = self._last_request + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        query = urllib.parse.urlencode({
+            'format': 'jsonv2', 'lat': lat, 'lon': lon, 'accept-language': 'ru'
+        })
+        request = urllib.request.Request(
+            f"{self.url}/reverse?{query}",
+            headers={'User-Agent': self.user_agent}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = json.loads(response.read().decode('utf-8'))
+        finally:
+            self._last_request = time.monotonic()
+        return data.get('display_name')
+
+
+class StaticProvider(GeocodingProvider):
+    """Локальная заглушка: адреса из словаря, счётчик обращений"""
+
+    def __init__(self, addresses: Optional[Dict[Key, str]] = None, default: Optional[str] = None):
+        self.addresses = addresses or {}
+        self.default = default
+        self.calls = 0
+
+    def reverse(self, lat: float, lon: float) -> Optional[str]:
+        self.calls += 1
+        return self.addresses.get((lat, lon), self.default)
+
+
+class PersistentLRUCache:
+    """LRU-кэш адресов с сохранением в JSON"""
+
+    def __init__(self, path: Optional[str] = None, capacity: int = 10000):
+        """
+        Args:
+            path (str): Путь к файлу кэша (None — только в памяти)
+            capacity (int): Максимальное число записей
+        """
+        self.path = path
+        self.capacity = capacity
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    @staticmethod
+    def _key(key: Key) -> str:
+        return f"{key[0]},{key[1]}"
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._items = OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            logger.exception("Ошибка загрузки кэша геокодирования")
+
+    def get(self, key: Key) -> Optional[str]:
+        """Адрес, NOT_FOUND для ненайденных координат или None, если записи нет"""
+        with self._lock:
+            value = self._items.get(self._key(key))
+            if value is not None:
+                self._items.move_to_end(self._key(key))
+            return value
+
+    def put(self, key: Key, value: str):
+        with self._lock:
+            self._items[self._key(key)] = value
+            self._items.move_to_end(self._key(key))
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+            self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(list(self._items.items()), ensure_ascii=False)
+            self._dirty = False
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            self._dirty = True
+            logger.exception("Ошибка сохранения кэша геокодирования")
+
+
+class ReverseGeocoder:
+    """Фоновая очередь обратного геокодирования с пакетной обработкой"""
+
+    def __init__(self, provider: Optional[GeocodingProvider], cache: PersistentLRUCache,
+                 on_resolved: Callable[[int, str, str], None], precision: int = 4,
+                 batch_size: int = 20, batch_window: float = 2.0):
+        """
+        Args:
+            provider (GeocodingProvider): Провайдер (None — геокодирование выключено)
+            cache (PersistentLRUCache): Кэш адресов
+            on_resolved: Обновление заявки: (номер строки, исходный адрес, найденный адрес)
+            precision (int): Знаков после запятой в ключе кэша (4 — около 11 м)
+            batch_size (int): Максимальный размер пачки
+            batch_window (float): Сколько ждать наполнения пачки, с
+        """
+        self.provider = provider
+        self.cache = cache
+        self.on_resolved = on_resolved
+        self.precision = precision
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def key(self, lat: float, lon: float) -> Key:
+        return (round(float(lat), self.precision), round(float(lon), self.precision))
+
+    def submit(self, row_index: Optional[int], lat: float, lon: float, raw_address: str):
+        """Ставит заявку в очередь, не дожидаясь геокодирования"""
+        if self.provider is None or row_index is None:
+            return
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        self._queue.put_nowait((row_index, self.key(lat, lon), raw_address))
+
+    async def close(self, timeout: float = 30.0):
+        """Дообрабатывает очередь перед остановкой, чтобы не терять поставленные заявки"""
+        if self._worker is not None and not self._worker.done():
+            # None — признак конца очереди: воркер дообработает всё до него и завершится
+            self._queue.put_nowait(None)
+            try:
+                await asyncio.wait_for(self._worker, timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Геокодирование не завершилось за {timeout} с, "
+                               f"в очереди осталось: {self._queue.qsize()}")
+        self._worker = None
+        self.cache.save()
+
+    async def _collect(self) -> Tuple[List[Tuple[int, Key, str]], bool]:
+        """Собирает пачку; второй элемент — встречен ли конец очереди"""
+        item = await self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            batch, stop = await self._collect()
+            if not batch:
+                continue
+            try:
+                await loop.run_in_executor(None, self._process, batch)
+            except Exception:
+                logger.exception("Ошибка обработки пачки геокодирования")
+
+    def _process(self, batch: List[Tuple[int, Key, str]]):
+        """Разрешает пачку: кэш, затем провайдер для уникальных промахов"""
+        addresses: Dict[Key, Optional[str]] = {}
+        for _, key, _ in batch:
+            if key not in addresses:
+                addresses[key] = self.cache.get(key)
+
+        misses = [key for key, address in addresses.items() if address is None]
+        if misses:
+            for key, address in self.provider.reverse_batch(misses).items():
+                addresses[key] = address
+                # Ненайденные координаты тоже кэшируем, чтобы не спрашивать провайдера повторно
+                self.cache.put(key, address or NOT_FOUND)
+            self.cache.save()
+        logger.info(f"Геокодирование: {len(batch)} заявок, запросов к провайдеру: {len(misses)}")
+
+        for row_index, key, raw_address in batch:
+            address = addresses.get(key)
+            if address:
+                self.on_resolved(row_index, raw_address, address)
+
+
+def build_provider(name: str) -> Optional[GeocodingProvider]:
+    if name == "nominatim":
+        return NominatimProvider(Config.NOMINATIM_URL, Config.GEOCODER_USER_AGENT)
+    if name == "none":
+        return None
+    raise ValueError(f"Неизвестный провайдер геокодирования: {name}")
+
+
+# 🎯 Экземпляр для использования
+reverse_geocoder = ReverseGeocoder(
+    build_provider(Config.GEOCODER_PROVIDER),
+    PersistentLRUCache(Config.GEOCODER_CACHE_PATH, Config.GEOCODER_CACHE_SIZE),
+    update_address
+)
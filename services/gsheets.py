@@ -7,7 +7,14 @@ import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
 import logging
+import re
+import threading
 from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+from config import Config
+from services.archive import COLUMNS, ArchiveService, ShardMap
+from services.stats import request_stats
 
 # Настройка логирования
 logging.basicConfig(
@@ -19,17 +26,22 @@ logger = logging.getLogger(__name__)
 class GoogleSheetsService:
     """Сервис для работы с Google Sheets"""
 
-    def __init__(self, creds_path: str, spreadsheet_name: str):
+    def __init__(self, creds_path: str, spreadsheet_name: str, shard_map: Optional[ShardMap] = None):
         """
         Инициализация сервиса
 
         Args:
             creds_path (str): Путь к файлу учетных данных
             spreadsheet_name (str): Название таблицы
+            shard_map (ShardMap): Карта архивных листов
         """
         self.creds_path = Path(creds_path)
         self.spreadsheet_name = spreadsheet_name
+        self.shard_map = shard_map or ShardMap()
+        self.spreadsheet = None
         self.worksheet = None
+        self._last_id: Optional[int] = None
+        self._id_lock = threading.Lock()
         self._authorize()
 
     def _authorize(self):
@@ -43,39 +55,221 @@ class GoogleSheetsService:
             ]
             creds = ServiceAccountCredentials.from_json_keyfile_name(str(self.creds_path), scope)
             client = gspread.authorize(creds)
-            sheet = client.open(self.spreadsheet_name)
-            self.worksheet = sheet.get_worksheet(0)
+            self.spreadsheet = client.open(self.spreadsheet_name)
+            self.worksheet = self.spreadsheet.get_worksheet(0)
             logger.info("Авторизация прошла успешно")
         except Exception as e:
             logger.exception("Ошибка авторизации")
 
-    def append_row(self, data: list):
-        """Добавление строки в таблицу"""
+    def append_row(self, data: list) -> Optional[int]:
+        """Добавление строки в таблицу, возвращает номер добавленной строки"""
         try:
-            self.worksheet.append_row(data, value_input_option="USER_ENTERED")
+            response = self.worksheet.append_row(data, value_input_option="USER_ENTERED")
             logger.info("Строка добавлена в таблицу")
+            # updatedRange вида "'Лист1'!A12:F12"
+            updated_range = (response or {}).get("updates", {}).get("updatedRange", "")
+            match = re.search(r"![A-Z]+(\d+)", updated_range)
+            return int(match.group(1)) if match else None
         except Exception as e:
             logger.exception("Ошибка при добавлении строки")
+            return None
+
+    def next_request_id(self) -> str:
+        """
+        Следующий ID заявки: на единицу больше максимального в рабочем листе
+        и в архиве. Новые строки добавляет только бот, поэтому максимум
+        читается из таблицы один раз, дальше счётчик ведётся в памяти.
+        """
+        with self._id_lock:
+            try:
+                if self._last_id is None:
+                    ids = [int(value) for value in self.worksheet.col_values(1)[1:] if str(value).strip().isdigit()]
+                    ids += [shard['max_id'] for shard in self.shard_map.shards.values() if shard['max_id'] is not None]
+                    self._last_id = max(ids, default=0)
+                self._last_id += 1
+                return str(self._last_id)
+            except Exception as e:
+                logger.exception("Ошибка при получении ID заявки")
+                return ""
+
+    def update_address(self, row_index: int, expected: str, address: str) -> bool:
+        """
+        Дополняет колонку 'Адрес' (2-я колонка) найденным адресом
+
+        Строка проверяется по исходному значению адреса: если строки
+        сдвинулись (архивация), она ищется заново в колонке B.
+        """
+        try:
+            if self.worksheet.cell(row_index, 2).value != expected:
+                # find() читает весь лист, достаточно колонки B
+                column = self.worksheet.col_values(2)
+                if expected not in column:
+                    logger.warning(f"Строка с адресом {expected!r} не найдена")
+                    return False
+                row_index = column.index(expected) + 1
+            self.worksheet.update_cell(row_index, 2, f"{address} ({expected})")
+            logger.info(f"Адрес строки {row_index} дополнен геокодированием")
+            return True
+        except Exception as e:
+            logger.exception("Ошибка при обновлении адреса")
+            return False
+
+    def get_or_create_worksheet(self, title: str, header: Optional[list] = None):
+        """Возвращает лист по названию, создавая его с заголовком при отсутствии"""
+        try:
+            return self.spreadsheet.worksheet(title)
+        except gspread.exceptions.WorksheetNotFound:
+            worksheet = self.spreadsheet.add_worksheet(title=title, rows=1, cols=len(header or COLUMNS))
+            if header:
+                worksheet.update("A1", [header])
+            logger.info(f"Создан лист {title}")
+            return worksheet
+
+    @staticmethod
+    def _find_row(worksheet, row_id: str, column: Optional[list] = None) -> Optional[int]:
+        """Номер строки с данным ID: читается только колонка A, а не весь лист, как в find()"""
+        column = worksheet.col_values(1) if column is None else column
+        try:
+            return column.index(str(row_id)) + 1
+        except ValueError:
+            return None
+
+    def _legacy_row(self, column: list, row_id: str) -> Optional[int]:
+        """
+        Строка старой заявки без ID, на которую ссылаются номером строки
+
+        Номер принимается, только если колонка A этой строки пуста: иначе
+        это чужая заявка с собственным ID.
+        """
+        if not str(row_id).isdigit() or int(row_id) < 2:
+            return None
+        row_index = int(row_id)
+        if row_index <= len(column):
+            return None if str(column[row_index - 1]).strip() else row_index
+        # col_values обрезает пустой хвост колонки
+        values = self.worksheet.row_values(row_index)
+        return row_index if values and not str(values[0]).strip() else None
 
-    def update_status(self, row_id: str, status: str):
+    def _locate(self, row_id: str) -> Tuple[Any, Optional[int]]:
+        """
+        Находит заявку: сначала в рабочем листе, затем в архивных листах
+        по карте шардов. Пока архива нет, старые строки без ID находятся
+        по номеру строки.
+        """
+        column = self.worksheet.col_values(1)
+        row_index = self._find_row(self.worksheet, row_id, column)
+        if row_index:
+            return self.worksheet, row_index
+        for title in self.shard_map.shards_for_id(row_id):
+            worksheet = self.spreadsheet.worksheet(title)
+            row_index = self._find_row(worksheet, row_id)
+            if row_index:
+                return worksheet, row_index
+        if not self.shard_map.shards:
+            row_index = self._legacy_row(column, row_id)
+            if row_index:
+                return self.worksheet, row_index
+        return None, None
+
+    def update_status(self, row_id: str, status: str) -> bool:
         """Обновление колонки 'Статус' (5-я колонка)"""
         try:
-            row_index = int(row_id)
-            self.worksheet.update_cell(row_index, 5, status)
+            worksheet, row_index = self._locate(row_id)
+            if worksheet is None:
+                logger.warning(f"Заявка {row_id} не найдена")
+                return False
+            worksheet.update_cell(row_index, 5, status)
             logger.info(f"Статус строки {row_id} обновлён на {status}")
+            return True
         except Exception as e:
             logger.exception("Ошибка при обновлении статуса")
+            return False
+
+    def update_files(self, row_id: str, files: str) -> bool:
+        """Запись ссылок на вложения в колонку 'Файлы' (6-я колонка)"""
+        try:
+            worksheet, row_index = self._locate(row_id)
+            if worksheet is None:
+                logger.warning(f"Заявка {row_id} не найдена")
+                return False
+            worksheet.update_cell(row_index, 6, files)
+            logger.info(f"Файлы добавлены к заявке {row_id}")
+            return True
+        except Exception as e:
+            logger.exception("Ошибка при добавлении файлов")
+            return False
+
+    def find_request(self, row_id: str) -> Optional[List[Any]]:
+        """Строка заявки по ID с учётом архивных листов"""
+        worksheet, row_index = self._locate(row_id)
+        if worksheet is None:
+            return None
+        return worksheet.row_values(row_index)
+
+    def get_requests(self, date_from: str, date_to: str) -> List[List[Any]]:
+        """
+        Заявки за интервал дат (YYYY-MM-DD, включительно): рабочий лист
+        и только те архивные листы, что пересекаются с интервалом
+        """
+        sources = [self.worksheet] + [
+            self.spreadsheet.worksheet(title)
+            for title in self.shard_map.shards_for_dates(date_from, date_to)
+        ]
+        rows = []
+        for worksheet in sources:
+            for row in worksheet.get_all_values()[1:]:
+                if len(row) > 3 and date_from <= str(row[3])[:10] <= date_to:
+                    rows.append(row)
+        return rows
+
+    def get_live_requests(self) -> List[List[Any]]:
+        """Заявки рабочего листа (без заголовка и архива)"""
+        return self.worksheet.get_all_values()[1:]
+
+    def get_all_requests(self) -> List[List[Any]]:
+        """Все заявки: рабочий лист и все архивные листы (без заголовков)"""
+        rows = self.worksheet.get_all_values()[1:]
+        for title in sorted(self.shard_map.shards):
+            rows.extend(self.spreadsheet.worksheet(title).get_all_values()[1:])
+        return rows
 
 
 # 🎯 Экземпляр для использования
 creds_file_path = "D:/programming/cadastr-bot/secure/cadastr-bots/client_secret.json"
 spreadsheet_name = "Кадастровые заявки"
 
-gs_service = GoogleSheetsService(creds_file_path, spreadsheet_name)
+gs_service = GoogleSheetsService(creds_file_path, spreadsheet_name, ShardMap(Config.SHARD_MAP_PATH))
+archive_service = ArchiveService(
+    gs_service,
+    gs_service.shard_map,
+    after_days=Config.ARCHIVE_AFTER_DAYS,
+    period=Config.ARCHIVE_PERIOD,
+    batch_size=Config.ARCHIVE_BATCH_SIZE
+)
 
 # ✏️ Утилиты
-def append_to_sheet(data: list):
-    gs_service.append_row(data)
+def append_to_sheet(data: list) -> Optional[int]:
+    # ID пишется сразу: по нему заявку находят смена статуса, статистика и архивация
+    if not data[0]:
+        data = [gs_service.next_request_id()] + list(data[1:])
+    row_index = gs_service.append_row(data)
+    if row_index is not None and data[0]:
+        # Формат строки: ID, Адрес, Телефон, Дата, Статус
+        request_stats.record_created(data[0], data[4], data[3])
+    return row_index
+
+def update_status(row_id: str, status: str) -> bool:
+    updated = gs_service.update_status(row_id, status)
+    if updated:
+        request_stats.record_status(row_id, status)
+    return updated
+
+
+def update_files(row_id: str, files: str) -> bool:
+    return gs_service.update_files(row_id, files)
+
+def update_address(row_index: int, expected: str, address: str) -> bool:
+    return gs_service.update_address(row_index, expected, address)
 
-def update_status(row_id: str, status: str):
-    gs_service.update_status(row_id, status)
+def archive_completed() -> dict:
+    return archive_service.archive()
\ No newline at end of file
@@ -0,0 +1,330 @@
+"""
+Модуль профилирования по запросу
+
+Позволяет без передеплоя снять профиль event loop, в котором работают
+клиентский бот, админ-панель и вызовы Google Sheets:
+- cProfile-захват всех функций потока event loop на N секунд
+- семплирование стеков потока event loop и занятых потоков-исполнителей
+  (run_in_executor: Google Sheets, геокодирование) в формате folded для flamegraph
+- постоянный сторож event loop: логирует callback'и, блокирующие его дольше порога
+"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+ASYNCIO_DIR = os.path.dirname(asyncio.__file__)
+LOOP_INTERNAL_FILES = {"selectors.py", "threading.py"}
+LOOP_INTERNAL_BUILTINS = ("select.", "_contextvars.", "_asyncio.")
+
+# Корень проекта: по нему в стеках потоков-исполнителей ищется код ботов
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ProfilerBusyError(RuntimeError):
+    """Захват профиля уже выполняется"""
+
+
+def _is_loop_internal(filename: str, lineno: int, name: str) -> bool:
+    """Функции самого event loop, которые заслоняют код ботов в сводке"""
+    if filename == "~":
+        return any(prefix in name for prefix in LOOP_INTERNAL_BUILTINS)
+    return filename.startswith(ASYNCIO_DIR) or os.path.basename(filename) in LOOP_INTERNAL_FILES
+
+
+def _format_stack(frame, limit: int = 5) -> str:
+    """Верхние limit кадров стека, начиная с текущего"""
+    stack = []
+    while frame is not None and len(stack) < limit:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return " ← ".join(stack)
+
+
+class SlowCallbackMonitor:
+    """
+    Сторож event loop
+
+    Корутина-пульс обновляет метку времени каждые check_interval секунд.
+    Фоновый поток замечает, что пульс пропал дольше порога, и снимает
+    стек потока event loop, пока тот ещё заблокирован. Когда пульс
+    возвращается, блокировка логируется вместе с этим стеком. В отличие
+    от loop.set_debug(True), сторож не замедляет event loop.
+    """
+
+    def __init__(self, threshold: float, check_interval: float = 0.05):
+        """
+        Args:
+            threshold (float): Порог блокировки, с
+            check_interval (float): Период пульса и проверки, с
+        """
+        self.threshold = threshold
+        self.check_interval = check_interval
+        self.listeners: List[List[str]] = []
+        self._beat = time.monotonic()
+        self._stall_stack: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Запускает сторож в текущем event loop"""
+        if self.running:
+            return
+        thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop_event.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(
+            target=self._watch, args=(thread_id,), name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Сторож event loop запущен (порог {self.threshold * 1000:.0f} мс)")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            now = time.monotonic()
+            lag = now - self._beat - self.check_interval
+            self._beat = now
+            if lag > self.threshold:
+                where, self._stall_stack = self._stall_stack or "стек не снят", None
+                message = f"{lag:.3f} с — {where}"
+                logger.warning(f"Event loop заблокирован на {message}")
+                for records in self.listeners:
+                    records.append(message)
+
+    def _watch(self, thread_id: int):
+        while not self._stop_event.wait(self.check_interval):
+            if self._stall_stack is None and time.monotonic() - self._beat > self.threshold + self.check_interval:
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    self._stall_stack = _format_stack(frame)
+
+
+def _is_idle(frame) -> bool:
+    """Поток ждёт работы: простаивающий исполнитель или ожидание в threading"""
+    filename = os.path.basename(frame.f_code.co_filename)
+    return filename == "threading.py" or (filename == "thread.py" and frame.f_code.co_name == "_worker")
+
+
+class _StackSampler(threading.Thread):
+    """
+    Фоновый поток, периодически снимающий стеки
+
+    Поток event loop семплируется всегда, остальные потоки — только пока
+    они заняты работой. cProfile видит лишь поток event loop, поэтому
+    вызовы из run_in_executor видны только здесь.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.worker_samples = 0
+        self.worker_hotspots: Counter = Counter()
+        self._names: Dict[int, str] = {}
+        self._stop_event = threading.Event()
+
+    def _thread_name(self, ident: int) -> str:
+        if ident not in self._names:
+            self._names = {thread.ident: thread.name for thread in threading.enumerate()}
+        return self._names.get(ident, str(ident))
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                is_loop = ident == self.thread_id
+                if ident == self.ident or (not is_loop and _is_idle(frame)):
+                    continue
+                stack = []
+                hotspot = None
+                while frame is not None:
+                    code = frame.f_code
+                    label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                    if hotspot is None and code.co_filename.startswith(PROJECT_DIR):
+                        hotspot = f"{code.co_name} ({os.path.basename(code.co_filename)})"
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append("event-loop" if is_loop else self._thread_name(ident))
+                self.stacks[";".join(reversed(stack))] += 1
+                if is_loop:
+                    self.samples += 1
+                else:
+                    self.worker_samples += 1
+                    self.worker_hotspots[hotspot or stack[0]] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class ProfileReport:
+    """Результат захвата профиля"""
+
+    def __init__(self, duration: float, profile_path: str, stacks_path: str,
+                 top_functions: List[tuple], samples: int, slow_callbacks: List[str],
+                 worker_samples: int = 0, worker_hotspots: Optional[List[tuple]] = None):
+        self.duration = duration
+        self.profile_path = profile_path
+        self.stacks_path = stacks_path
+        self.top_functions = top_functions
+        self.samples = samples
+        self.slow_callbacks = slow_callbacks
+        self.worker_samples = worker_samples
+        self.worker_hotspots = worker_hotspots or []
+
+    def format_summary(self) -> str:
+        """Краткая сводка для отправки в Telegram"""
+        lines = [f"⏱ Профиль за {self.duration:.0f} с, семплов стека: {self.samples}", ""]
+        lines.append("Топ функций event loop по собственному времени (cumtime / tottime / вызовы):")
+        for name, cumtime, tottime, calls in self.top_functions:
+            lines.append(f"{cumtime:8.3f} {tottime:8.3f} {calls:>7}  {name}")
+        lines.append("")
+        # cProfile не видит потоки-исполнители, для них — доля семплов
+        lines.append(f"🧵 Потоки-исполнители, семплов в работе: {self.worker_samples}")
+        for name, count in self.worker_hotspots:
+            lines.append(f"{count / self.worker_samples:7.1%}  {name}")
+        lines.append("")
+        lines.append(f"🐢 Медленных callback'ов: {len(self.slow_callbacks)}")
+        for message in self.slow_callbacks[:5]:
+            lines.append(f"  {message}")
+        lines.append("")
+        lines.append(f"💾 Профиль: {self.profile_path}")
+        lines.append(f"🔥 Стеки: {self.stacks_path}")
+        return "\n".join(lines)
+
+
+class ProfilerService:
+    """Сервис захвата профиля event loop"""
+
+    def __init__(self, output_dir: str, sample_interval_ms: int, slow_callback_ms: int, top: int = 15):
+        """
+        Инициализация сервиса
+
+        Args:
+            output_dir (str): Папка для сохранения профилей
+            sample_interval_ms (int): Интервал семплирования стека в мс
+            slow_callback_ms (int): Порог медленного callback в мс
+            top (int): Количество функций в сводке
+        """
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval_ms / 1000
+        self.monitor = SlowCallbackMonitor(slow_callback_ms / 1000)
+        self.top = top
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    async def capture(self, duration: float) -> ProfileReport:
+        """
+        Снимает профиль потока event loop в течение duration секунд
+
+        Raises:
+            ProfilerBusyError: Если захват уже выполняется
+        """
+        if self._running:
+            raise ProfilerBusyError("Профилирование уже запущено")
+        self._running = True
+
+        loop = asyncio.get_running_loop()
+        slow_callbacks: List[str] = []
+        # Если постоянный сторож выключен, включаем его на время захвата
+        own_monitor = not self.monitor.running
+        profiler = cProfile.Profile()
+        sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+
+        logger.info(f"Запуск профилирования на {duration} с")
+        started = time.perf_counter()
+        try:
+            if own_monitor:
+                self.monitor.start()
+            self.monitor.listeners.append(slow_callbacks)
+            sampler.start()
+            profiler.enable()
+            try:
+                await asyncio.sleep(duration)
+            finally:
+                profiler.disable()
+                sampler.stop()
+                self.monitor.listeners.remove(slow_callbacks)
+                if own_monitor:
+                    self.monitor.stop()
+            elapsed = time.perf_counter() - started
+            report = await loop.run_in_executor(
+                None, self._save, profiler, sampler, slow_callbacks, elapsed
+            )
+        finally:
+            self._running = False
+
+        logger.info(f"Профиль сохранён: {report.profile_path}")
+        return report
+
+    def _save(self, profiler: cProfile.Profile, sampler: _StackSampler,
+              slow_callbacks: List[str], elapsed: float) -> ProfileReport:
+        """Сохраняет профиль и стеки на диск, собирает сводку"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        profile_path = os.path.join(self.output_dir, f"profile_{stamp}.prof")
+        stacks_path = os.path.join(self.output_dir, f"stacks_{stamp}.folded")
+
+        profiler.dump_stats(profile_path)
+        with open(stacks_path, "w", encoding="utf-8") as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        # Собственное время без механики event loop (ожидание в select и т.п.)
+        entries = sorted(
+            (item for item in stats.stats.items() if not _is_loop_internal(*item[0])),
+            key=lambda item: item[1][2],
+            reverse=True
+        )
+        top_functions = []
+        for (filename, lineno, name), (_, ncalls, tottime, cumtime, _) in entries[:self.top]:
+            label = f"{os.path.basename(filename)}:{lineno}({name})" if lineno else name
+            top_functions.append((label, cumtime, tottime, ncalls))
+
+        return ProfileReport(elapsed, profile_path, stacks_path, top_functions,
+                             sampler.samples, slow_callbacks, sampler.worker_samples,
+                             sampler.worker_hotspots.most_common(5))
+
+
+# 🎯 Экземпляр для использования
+profiler_service = ProfilerService(
+    Config.PROFILE_DIR,
+    Config.PROFILE_SAMPLE_INTERVAL_MS,
+    Config.SLOW_CALLBACK_MS
+)
@@ -0,0 +1,337 @@
+"""
+Модуль инкрементальной статистики заявок
+
+Статистика обновляется по событиям (добавление заявки, смена статуса),
+а не сканированием таблицы при каждом запросе, поэтому команда /stats отвечает за время,
+не зависящее от размера реестра:
+- счётчики заявок по статусам
+- количество новых заявок по дням
+- потоковая оценка квантилей времени от "Новая" до "Завершена"
+
+Правки, сделанные прямо в таблице, боту не приходят: их подхватывает
+периодическая сверка с рабочим листом (reconcile).
+
+Состояние сохраняется в компактный JSON-снимок плановой задачей
+админ-панели и при остановке ботов.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import pytz
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+TIMEZONE = pytz.timezone("Europe/Moscow")
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Форматы дат, встречающиеся в таблице (ручной ввод бывает без секунд)
+SHEET_DATE_FORMATS = (DATE_FORMAT, "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+STATUS_NEW = "Новая"
+STATUS_IN_PROGRESS = "В работе"
+STATUS_DONE = "Завершена"
+
+SNAPSHOT_VERSION = 1
+
+
+class QuantileSketch:
+    """
+    Потоковая оценка квантилей на логарифмических корзинах
+
+    Относительная погрешность не превышает accuracy, число корзин
+    ограничено max_buckets, поэтому запрос квантиля занимает O(1)
+    относительно числа наблюдений.
+    """
+
+    def __init__(self, accuracy: float = 0.01, max_buckets: int = 2048):
+        self.accuracy = accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        if len(self.buckets) > self.max_buckets:
+            # Объединяем две самые нижние корзины
+            lowest, second = sorted(self.buckets)[:2]
+            self.buckets[second] += self.buckets.pop(lowest)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'accuracy': self.accuracy,
+            'max_buckets': self.max_buckets,
+            'zeros': self.zeros,
+            'buckets': {str(k): v for k, v in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'QuantileSketch':
+        sketch = cls(data.get('accuracy', 0.01), data.get('max_buckets', 2048))
+        sketch.zeros = data.get('zeros', 0)
+        sketch.buckets = {int(k): v for k, v in data.get('buckets', {}).items()}
+        sketch.count = sketch.zeros + sum(sketch.buckets.values())
+        return sketch
+
+
+def parse_sheet_time(value: Any) -> datetime:
+    """Приводит дату из таблицы или datetime к aware-datetime в TIMEZONE"""
+    if isinstance(value, datetime):
+        return value if value.tzinfo else TIMEZONE.localize(value)
+    for date_format in SHEET_DATE_FORMATS:
+        try:
+            return TIMEZONE.localize(datetime.strptime(str(value).strip(), date_format))
+        except (TypeError, ValueError):
+            continue
+    return datetime.now(TIMEZONE)
+
+
+class RequestStats:
+    """Событийный движок статистики заявок"""
+
+    def __init__(self, snapshot_path: Optional[str] = None, snapshot_interval: float = 60,
+                 retention_days: int = 400):
+        """
+        Args:
+            snapshot_path (str): Путь к JSON-снимку (None — без сохранения)
+            snapshot_interval (float): Минимальный интервал между сохранениями, с
+            retention_days (int): Сколько дней хранить дневные корзины
+        """
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.retention_days = retention_days
+
+        self.status_counts: Counter = Counter()
+        self.daily_new: Dict[str, int] = {}
+        self.statuses: Dict[str, str] = {}
+        self.open_since: Dict[str, float] = {}
+        self.completion = QuantileSketch()
+
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    # ====================
+    # 📥 СОБЫТИЯ
+    # ====================
+
+    def record_created(self, row_id: Any, status: str = STATUS_NEW, created_at: Any = None):
+        """Новая заявка (append_to_sheet или уведомление из таблицы)"""
+        row_id = str(row_id)
+        with self._lock:
+            if row_id in self.statuses:
+                self._change_status(row_id, status, datetime.now(TIMEZONE))
+            else:
+                self._add(row_id, status, parse_sheet_time(created_at) if created_at else datetime.now(TIMEZONE))
+        self.maybe_save()
+
+    def record_status(self, row_id: Any, status: str, at: Any = None):
+        """Смена статуса (update_status или правка в таблице)"""
+        with self._lock:
+            self._change_status(str(row_id), status, parse_sheet_time(at) if at else datetime.now(TIMEZONE))
+        self.maybe_save()
+
+    def _add(self, row_id: str, status: str, created: datetime):
+        self.statuses[row_id] = status
+        self.status_counts[status] += 1
+        self._add_daily(created.strftime("%Y-%m-%d"))
+        if status != STATUS_DONE:
+            self.open_since[row_id] = created.timestamp()
+        self._dirty = True
+
+    def _change_status(self, row_id: str, status: str, at: datetime):
+        previous = self.statuses.get(row_id)
+        if previous == status:
+            return
+        if previous is not None:
+            self.status_counts[previous] -= 1
+        self.status_counts[status] += 1
+        self.statuses[row_id] = status
+
+        if status == STATUS_DONE:
+            created = self.open_since.pop(row_id, None)
+            if created is not None:
+                self.completion.add(at.timestamp() - created)
+        self._dirty = True
+
+    def _add_daily(self, day: str):
+        self.daily_new[day] = self.daily_new.get(day, 0) + 1
+        if len(self.daily_new) > self.retention_days:
+            del self.daily_new[min(self.daily_new)]
+
+    def rebuild(self, rows: List[List[Any]]):
+        """
+        Полная перестройка по строкам таблицы (без заголовка)
+
+        Нужна один раз, если снимка ещё нет. Время завершения старых
+        заявок неизвестно, поэтому они не попадают в квантили.
+        """
+        with self._lock:
+            self.status_counts.clear()
+            self.daily_new.clear()
+            self.statuses.clear()
+            self.open_since.clear()
+            self.completion = QuantileSketch()
+            for index, row in enumerate(rows, start=2):
+                row = list(row) + [""] * (5 - len(row))
+                self._add(str(row[0] or index), row[4] or STATUS_NEW, parse_sheet_time(row[3]))
+            self._dirty = True
+        self.save()
+
+    def reconcile(self, rows: List[List[Any]]) -> int:
+        """
+        Сверка с рабочим листом (строки без заголовка)
+
+        Ловит то, что не проходит через бота: статусы, изменённые прямо
+        в таблице, и строки, добавленные вручную. Время завершения таких
+        заявок известно с точностью до интервала сверки. Строки без ID
+        пропускаются, архивные заявки не затрагиваются.
+
+        Returns:
+            int: Число исправленных заявок
+        """
+        now = datetime.now(TIMEZONE)
+        changed = 0
+        with self._lock:
+            for row in rows:
+                row = list(row) + [""] * (5 - len(row))
+                row_id = str(row[0]).strip()
+                status = row[4] or STATUS_NEW
+                if not row_id or self.statuses.get(row_id) == status:
+                    continue
+                if row_id in self.statuses:
+                    self._change_status(row_id, status, now)
+                else:
+                    self._add(row_id, status, parse_sheet_time(row[3]))
+                changed += 1
+        if changed:
+            logger.info(f"Сверка статистики с таблицей: исправлено заявок {changed}")
+        self.maybe_save()
+        return changed
+
+    # ====================
+    # 📊 ЗАПРОСЫ
+    # ====================
+
+    def summary(self, today: Optional[datetime] = None) -> Dict[str, Any]:
+        """Сводка за O(1) относительно числа заявок"""
+        today = today or datetime.now(TIMEZONE)
+        with self._lock:
+            days = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(30)]
+            return {
+                'statuses': {k: v for k, v in self.status_counts.items() if v},
+                'total': sum(self.status_counts.values()),
+                'new_today': self.daily_new.get(days[0], 0),
+                'new_yesterday': self.daily_new.get(days[1], 0),
+                'new_7d': sum(self.daily_new.get(day, 0) for day in days[:7]),
+                'new_30d': sum(self.daily_new.get(day, 0) for day in days),
+                'completed_measured': self.completion.count,
+                'completion_p50': self.completion.quantile(0.5),
+                'completion_p90': self.completion.quantile(0.9),
+            }
+
+    # ====================
+    # 💾 СНИМКИ
+    # ====================
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'version': SNAPSHOT_VERSION,
+            'status_counts': dict(self.status_counts),
+            'daily_new': self.daily_new,
+            'statuses': self.statuses,
+            'open_since': self.open_since,
+            'completion': self.completion.to_dict(),
+        }
+
+    def save(self):
+        """Атомарно сохраняет снимок на диск"""
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self.to_dict(), ensure_ascii=False, separators=(',', ':'))
+            self._dirty = False
+            self._last_save = time.monotonic()
+        try:
+            directory = os.path.dirname(self.snapshot_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError:
+            self._dirty = True
+            logger.exception("Ошибка сохранения снимка статистики")
+
+    def maybe_save(self):
+        """Сохранение по ходу событий, если плановая задача не успела"""
+        if self._dirty and time.monotonic() - self._last_save >= self.snapshot_interval:
+            self.save()
+
+    @classmethod
+    def load(cls, snapshot_path: Optional[str], **kwargs) -> 'RequestStats':
+        """Загружает снимок, если он есть, иначе создаёт пустую статистику"""
+        stats = cls(snapshot_path, **kwargs)
+        if not snapshot_path or not os.path.exists(snapshot_path):
+            return stats
+        try:
+            with open(snapshot_path, encoding='utf-8') as f:
+                data = json.load(f)
+            stats.status_counts = Counter(data.get('status_counts', {}))
+            stats.daily_new = data.get('daily_new', {})
+            stats.statuses = data.get('statuses', {})
+            stats.open_since = data.get('open_since', {})
+            stats.completion = QuantileSketch.from_dict(data.get('completion', {}))
+            logger.info(f"Статистика загружена из снимка: {snapshot_path}")
+        except (OSError, ValueError):
+            logger.exception("Ошибка загрузки снимка статистики")
+        return stats
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    hours = seconds / 3600
+    if hours < 48:
+        return f"{hours:.1f} ч"
+    return f"{hours / 24:.1f} дн"
+
+
+# 🎯 Экземпляр для использования
+request_stats = RequestStats.load(
+    Config.STATS_SNAPSHOT_PATH,
+    snapshot_interval=Config.STATS_SNAPSHOT_SECONDS
+)
@@ -0,0 +1,223 @@
+"""
+Модуль записи входящего трафика ботов
+
+Записывает входящие обновления Telegram в компактный JSONL-журнал
+(сжатый gzip, если имя файла оканчивается на .gz) для последующего
+воспроизведения через replay.py.
+
+Персональные данные обезличиваются до записи:
+- телефоны заменяются на детерминированные фиктивные номера
+- адреса, произвольный текст, имена файлов и все прочие строки заменяются
+  хэшами; как есть остаются только служебные поля из SAFE_FIELDS
+- координаты заменяются псевдокоординатами
+- ID пользователей и чатов хэшируются, имена удаляются или заменяются
+"""
+
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from telegram import Update
+from telegram.ext import ContextTypes, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+# Похоже на телефон: 10-15 цифр с разделителями
+PHONE_RE = re.compile(r'^\+?[\d\s\-\(\)]{10,20}$')
+
+# Поля, которые удаляются полностью
+DROP_FIELDS = {'last_name', 'username', 'bio', 'vcard'}
+
+# Строковые поля без персональных данных, нужные для разбора и маршрутизации
+# обновлений; любая другая строка (url, venue.address и т.п.) хэшируется
+SAFE_FIELDS = {
+    'type', 'status', 'mime_type', 'file_id', 'file_unique_id', 'data',
+    'language_code', 'media_group_id', 'emoji', 'game_short_name',
+}
+
+# Обязательные для Telegram поля, значение которых заменяется заглушкой
+REDACT_FIELDS = {'first_name', 'title'}
+
+# Как часто сбрасывать буфер на диск, с (flush gzip на каждой строке портит сжатие)
+FLUSH_SECONDS = 5.0
+
+
+class TrafficAnonymizer:
+    """Обезличивание обновлений с сохранением структуры диалогов"""
+
+    def __init__(self, salt: bytes, keep_texts: Iterable[str] = ()):
+        """
+        Args:
+            salt (bytes): Секретная соль HMAC (не записывается в журнал)
+            keep_texts: Тексты, сохраняемые как есть (кнопки меню)
+        """
+        self.salt = salt
+        self.keep_texts = set(keep_texts)
+
+    def _digest(self, value: Any) -> bytes:
+        return hmac.new(self.salt, str(value).encode('utf-8'), hashlib.sha256).digest()
+
+    def hash_text(self, value: Any) -> str:
+        return self._digest(value).hex()[:16]
+
+    def hash_id(self, value: int) -> int:
+        # Знак сохраняется: отрицательные ID означают группы
+        hashed = int.from_bytes(self._digest(value)[:6], 'big')
+        return -hashed if value < 0 else hashed
+
+    def fake_phone(self, phone: str) -> str:
+        """Детерминированный номер в формате, который принимает клиентский бот"""
+        digits = str(int.from_bytes(self._digest(re.sub(r'\D', '', phone))[:8], 'big')).zfill(9)
+        return f"+7 9{digits[0:2]} {digits[2:5]} {digits[5:7]} {digits[7:9]}"
+
+    def fake_location(self, lat: float, lon: float) -> Dict[str, float]:
+        digest = self._digest(f"{lat:.5f},{lon:.5f}")
+        return {
+            'latitude': round(int.from_bytes(digest[:4], 'big') / 2**32 * 180 - 90, 6),
+            'longitude': round(int.from_bytes(digest[4:8], 'big') / 2**32 * 360 - 180, 6),
+        }
+
+    def anonymize_text(self, text: str) -> str:
+        if text.startswith('/') or text in self.keep_texts:
+            return text
+        # Формат уведомления: ID;Адрес;Телефон;Дата;Статус
+        parts = text.split(';')
+        if len(parts) == 5:
+            parts[1] = f"addr:{self.hash_text(parts[1])}"
+            parts[2] = self.fake_phone(parts[2])
+            return ';'.join(parts)
+        if PHONE_RE.match(text.strip()):
+            return self.fake_phone(text)
+        return f"addr:{self.hash_text(text)}"
+
+    def anonymize(self, data: Any, key: Optional[str] = None) -> Any:
+        """Рекурсивно обезличивает словарь обновления"""
+        if isinstance(data, dict):
+            result = {}
+            for k, v in data.items():
+                if k in DROP_FIELDS:
+                    continue
+                if k in REDACT_FIELDS:
+                    result[k] = 'anon'
+                    continue
+                if k == 'location' and isinstance(v, dict):
+                    result[k] = {**v, **self.fake_location(v.get('latitude', 0), v.get('longitude', 0))}
+                else:
+                    result[k] = self.anonymize(v, k)
+            return result
+        if isinstance(data, list):
+            return [self.anonymize(item, key) for item in data]
+        if key in ('id', 'user_id', 'chat_id') and isinstance(data, int) and not isinstance(data, bool):
+            return self.hash_id(data)
+        if key == 'phone_number' and isinstance(data, str):
+            return self.fake_phone(data)
+        if key in ('text', 'caption') and isinstance(data, str):
+            return self.anonymize_text(data)
+        if key == 'file_name' and isinstance(data, str):
+            return f"file:{self.hash_text(data)}{os.path.splitext(data)[1]}"
+        if isinstance(data, str) and key not in SAFE_FIELDS:
+            return f"str:{self.hash_text(data)}"
+        return data
+
+
+class TrafficRecorder:
+    """Запись обезличенных обновлений в JSONL-журнал"""
+
+    def __init__(self, path: str, salt: Optional[bytes] = None):
+        """
+        Args:
+            path (str): Путь к журналу (.jsonl или .jsonl.gz)
+            salt (bytes): Соль для хэширования, по умолчанию случайная
+        """
+        self.path = path
+        self.salt = salt or os.urandom(32)
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_flush = 0.0
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, 'at', encoding='utf-8')
+        return open(self.path, 'a', encoding='utf-8')
+
+    def record(self, bot: str, update: Dict[str, Any], anonymizer: TrafficAnonymizer):
+        """Записывает одно обновление"""
+        line = json.dumps(
+            {'t': round(time.time(), 3), 'bot': bot, 'update': anonymizer.anonymize(update)},
+            ensure_ascii=False,
+            separators=(',', ':')
+        )
+        with self._lock:
+            if self._file is None:
+                self._file = self._open()
+            self._file.write(line + '\n')
+            now = time.monotonic()
+            if now - self._last_flush >= FLUSH_SECONDS:
+                self._file.flush()
+                self._last_flush = now
+
+    def handler(self, bot: str, keep_texts: Iterable[str] = ()) -> TypeHandler:
+        """Возвращает обработчик для группы -1, записывающий каждое обновление"""
+        anonymizer = TrafficAnonymizer(self.salt, keep_texts)
+
+        async def capture(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            try:
+                self.record(bot, update.to_dict(), anonymizer)
+            except Exception:
+                logger.exception("Ошибка записи трафика")
+
+        return TypeHandler(Update, capture)
+
+    def close(self):
+        """Закрывает журнал (для gzip — дописывает конец потока); вызывается при остановке бота"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_traffic(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Читает записи журнала трафика
+
+    Журнал процесса, остановленного аварийно, может оборваться: у gzip нет
+    конца потока, последняя строка записана не полностью. Такой хвост
+    пропускается с предупреждением, всё записанное до него читается.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning(f"Пропущена повреждённая строка журнала {path}")
+        except (EOFError, gzip.BadGzipFile):
+            logger.warning(f"Журнал {path} оборван, прочитано до места обрыва")
+
+
+_recorder: Optional[TrafficRecorder] = None
+
+
+def get_recorder(path: Optional[str]) -> Optional[TrafficRecorder]:
+    """Общий экземпляр записи для всех ботов процесса (None, если запись выключена)"""
+    global _recorder
+    if not path:
+        return None
+    if _recorder is None or _recorder.path != path:
+        _recorder = TrafficRecorder(path)
+        logger.info(f"Запись трафика включена: {path}")
+    return _recorder
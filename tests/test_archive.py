@@ -0,0 +1,115 @@
+from datetime import datetime
+
+from services.archive import COLUMNS, ArchiveService, ShardMap
+from services.stats import STATUS_DONE, STATUS_NEW, TIMEZONE
+
+NOW = TIMEZONE.localize(datetime(2025, 9, 1))
+
+
+class InMemoryWorksheet:
+    def __init__(self, rows, sheet_id=0):
+        self.rows = [list(row) for row in rows]
+        self.id = sheet_id
+
+    def get_all_values(self):
+        return [list(row) for row in self.rows]
+
+    def col_values(self, col):
+        return [row[col - 1] for row in self.rows]
+
+    def append_rows(self, rows, value_input_option=None):
+        self.rows.extend(list(row) for row in rows)
+
+
+class InMemorySpreadsheet:
+    def __init__(self, live):
+        self.live = live
+        self.worksheets = {}
+        self.batches = []
+
+    def batch_update(self, body):
+        self.batches.append(body)
+        for request in body["requests"]:
+            rng = request["deleteDimension"]["range"]
+            assert rng["sheetId"] == self.live.id
+            del self.live.rows[rng["startIndex"]:rng["endIndex"]]
+
+
+class InMemorySheetsService:
+    def __init__(self, rows):
+        self.worksheet = InMemoryWorksheet(rows, sheet_id=7)
+        self.spreadsheet = InMemorySpreadsheet(self.worksheet)
+
+    def get_or_create_worksheet(self, title, header):
+        return self.spreadsheet.worksheets.setdefault(title, InMemoryWorksheet([header], sheet_id=1))
+
+
+def request(row_id, date, status=STATUS_DONE):
+    return [str(row_id), f"адрес {row_id}", "+7 900 000 00 00", f"{date} 10:00:00", status, ""]
+
+
+def test_archive_deletes_contiguous_ranges_in_one_batch():
+    service = InMemorySheetsService([
+        COLUMNS,
+        request(1, "2025-01-10"),
+        request(2, "2025-01-11"),
+        request(3, "2025-01-12", STATUS_NEW),
+        request(4, "2025-02-01"),
+        request(5, "2025-08-30"),
+    ])
+    shard_map = ShardMap()
+    moved = ArchiveService(service, shard_map, after_days=30).archive(NOW)
+
+    assert moved == {"Архив 2025-01": 2, "Архив 2025-02": 1}
+    assert len(service.spreadsheet.batches) == 1
+    ranges = [
+        (r["deleteDimension"]["range"]["startIndex"], r["deleteDimension"]["range"]["endIndex"])
+        for r in service.spreadsheet.batches[0]["requests"]
+    ]
+    # Снизу вверх: удаление строки 5 не сдвигает строки 2-3
+    assert ranges == [(4, 5), (1, 3)]
+    assert [row[0] for row in service.worksheet.rows] == ["ID", "3", "5"]
+    assert shard_map.shards["Архив 2025-01"]["min_id"] == 1
+    assert shard_map.shards["Архив 2025-01"]["max_id"] == 2
+    assert shard_map.shards_for_id(4) == ["Архив 2025-02"]
+
+
+def test_archive_retry_registers_rows_left_by_failed_run():
+    service = InMemorySheetsService([COLUMNS, request(1, "2025-01-10"), request(2, "2025-01-11")])
+    # Прошлая попытка записала строку 1 в архив, но карта шардов не сохранилась
+    shard = service.get_or_create_worksheet("Архив 2025-01", COLUMNS)
+    shard.append_rows([request(1, "2025-01-10")])
+
+    shard_map = ShardMap()
+    moved = ArchiveService(service, shard_map, after_days=30).archive(NOW)
+
+    assert moved == {"Архив 2025-01": 2}
+    assert [row[0] for row in shard.rows] == ["ID", "1", "2"]
+    assert shard_map.shards["Архив 2025-01"]["rows"] == 1
+    assert shard_map.shards_for_id(1) == ["Архив 2025-01"]
+    assert [row[0] for row in service.worksheet.rows] == ["ID"]
+
+
+def test_archive_skips_rows_that_shifted():
+    service = InMemorySheetsService([COLUMNS, request(1, "2025-01-10"), request(2, "2025-03-10", STATUS_NEW)])
+    archive = ArchiveService(service, ShardMap(), after_days=30)
+    read_column = service.worksheet.col_values
+
+    def shifted_col_values(col):
+        # Между чтением листа и удалением кто-то вставил строку сверху
+        return [read_column(col)[0], "99"] + read_column(col)[1:]
+
+    service.worksheet.col_values = shifted_col_values
+    assert archive.archive(NOW) == {"Архив 2025-01": 1}
+    assert service.spreadsheet.batches == []
+    assert len(service.worksheet.rows) == 3
+
+
+def test_shards_for_dates_ignores_shards_without_dates():
+    shard_map = ShardMap()
+    shard_map.register("Архив 2025-01", [request(1, "2025-01-10")])
+    shard_map.shards["Архив пустой"] = {
+        'min_id': None, 'max_id': None, 'date_from': None, 'date_to': None, 'rows': 0
+    }
+    assert shard_map.shards_for_dates("2025-01-01", "2025-12-31") == ["Архив 2025-01"]
+    assert shard_map.shards_for_dates("2025-02-01", "2025-12-31") == []
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from services.geocoding import (
+    NOT_FOUND, GeocodingProvider, PersistentLRUCache, ReverseGeocoder, StaticProvider
+)
+
+
+def make_geocoder(provider, capacity=10000):
+    resolved = []
+    geocoder = ReverseGeocoder(
+        provider, PersistentLRUCache(capacity=capacity),
+        lambda row, raw, address: resolved.append((row, raw, address))
+    )
+    return geocoder, resolved
+
+
+def test_repeat_lookups_are_served_from_cache():
+    provider = StaticProvider({(55.7558, 37.6173): "Красная площадь"})
+    geocoder, resolved = make_geocoder(provider)
+    key = geocoder.key(55.75581, 37.61729)
+
+    geocoder._process([(2, key, "raw"), (3, key, "raw")])
+    assert provider.calls == 1
+    geocoder._process([(4, key, "raw")])
+    assert provider.calls == 1
+    assert [row for row, _, _ in resolved] == [2, 3, 4]
+
+
+def test_not_found_is_cached_too():
+    provider = StaticProvider()
+    geocoder, resolved = make_geocoder(provider)
+    key = geocoder.key(10, 20)
+
+    geocoder._process([(2, key, "raw")])
+    geocoder._process([(3, key, "raw")])
+    assert provider.calls == 1
+    assert geocoder.cache.get(key) == NOT_FOUND
+    assert resolved == []
+
+
+def test_failed_lookup_is_not_cached():
+    class FlakyProvider(GeocodingProvider):
+        def __init__(self):
+            self.calls = 0
+
+        def reverse(self, lat, lon):
+            self.calls += 1
+            if self.calls == 1:
+                raise OSError("timeout")
+            return "Адрес"
+
+    provider = FlakyProvider()
+    geocoder, resolved = make_geocoder(provider)
+    key = geocoder.key(1, 2)
+
+    geocoder._process([(2, key, "raw")])
+    assert geocoder.cache.get(key) is None
+    geocoder._process([(3, key, "raw")])
+    assert provider.calls == 2
+    assert resolved == [(3, "raw", "Адрес")]
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = PersistentLRUCache(capacity=2)
+    cache.put((1, 1), "a")
+    cache.put((2, 2), NOT_FOUND)
+    assert cache.get((1, 1)) == "a"
+    cache.put((3, 3), "c")
+    assert cache.get((2, 2)) is None
+    assert len(cache) == 2
+
+
+def test_close_drains_queue():
+    provider = StaticProvider(default="Адрес")
+    geocoder, resolved = make_geocoder(provider)
+    geocoder.batch_window = 60
+
+    async def scenario():
+        for row in range(3):
+            geocoder.submit(row + 2, 55 + row, 37, "raw")
+        await geocoder.close(timeout=5)
+
+    asyncio.run(scenario())
+    assert [row for row, _, _ in resolved] == [2, 3, 4]
+
+
+def test_provider_is_abstract():
+    with pytest.raises(TypeError):
+        GeocodingProvider()
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.stats import (
+    DATE_FORMAT, STATUS_DONE, STATUS_IN_PROGRESS, STATUS_NEW, TIMEZONE, QuantileSketch, RequestStats
+)
+
+
+def test_quantile_sketch_relative_error():
+    sketch = QuantileSketch(accuracy=0.01)
+    for value in range(1, 10001):
+        sketch.add(value)
+    for q in (0.5, 0.9, 0.99):
+        assert sketch.quantile(q) == pytest.approx(q * 10000, rel=0.02)
+
+
+def test_quantile_sketch_round_trip():
+    sketch = QuantileSketch()
+    assert sketch.quantile(0.5) is None
+    for value in (0.5, 3, 120, 3600):
+        sketch.add(value)
+    restored = QuantileSketch.from_dict(sketch.to_dict())
+    assert restored.quantile(0.5) == sketch.quantile(0.5)
+
+
+def test_reconcile_picks_up_sheet_edits():
+    stats = RequestStats()
+    created = (datetime.now(TIMEZONE) - timedelta(hours=1)).strftime(DATE_FORMAT)
+    stats.record_created("1", STATUS_NEW, created)
+    rows = [
+        ["1", "адрес", "телефон", created, STATUS_DONE, ""],
+        ["2", "адрес", "телефон", created, STATUS_IN_PROGRESS, ""],
+        ["", "адрес", "телефон", created, STATUS_NEW, ""],
+    ]
+    assert stats.reconcile(rows) == 2
+    assert stats.reconcile(rows) == 0
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+from telegram import Update
+
+from services.traffic import TrafficAnonymizer
+
+PII = ("9001234567", "Тверская", "Иван", "Петров", "ivan")
+
+CALLBACK = {
+    "update_id": 1,
+    "callback_query": {
+        "id": "77", "chat_instance": "ci", "data": "status|42|В работе",
+        "from": {"id": 5, "is_bot": False, "first_name": "Иван", "username": "ivan"},
+        "message": {
+            "message_id": 3, "date": 1,
+            "chat": {"id": -100, "type": "group", "title": "Админы"},
+            "text": "📬 Новая заявка\n\n📍 Адрес: ул. Тверская, 7\n📞 Телефон: +7 900 123 45 67",
+            "reply_markup": {"inline_keyboard": [[{"text": "📞 Позвонить", "url": "tel:+79001234567"}]]},
+        },
+    },
+}
+
+VENUE = {
+    "update_id": 2,
+    "message": {
+        "message_id": 4, "date": 1,
+        "chat": {"id": 5, "type": "private", "first_name": "Иван"},
+        "venue": {
+            "location": {"latitude": 55.7, "longitude": 37.6},
+            "title": "Кафе", "address": "ул. Тверская, 7, Москва",
+        },
+        "location": {"latitude": 55.7, "longitude": 37.6},
+    },
+}
+
+CONTACT = {
+    "update_id": 3,
+    "message": {
+        "message_id": 5, "date": 1,
+        "chat": {"id": 5, "type": "private", "first_name": "Иван"},
+        "contact": {
+            "phone_number": "+79001234567", "first_name": "Иван",
+            "vcard": "BEGIN:VCARD\nFN:Иван Петров\nTEL:+79001234567\nEND:VCARD",
+        },
+    },
+}
+
+
+@pytest.mark.parametrize("payload", [CALLBACK, VENUE, CONTACT], ids=["callback", "venue", "contact"])
+def test_anonymize_removes_pii_and_keeps_update_parseable(payload):
+    anonymized = TrafficAnonymizer(b"salt").anonymize(payload)
+    dumped = json.dumps(anonymized, ensure_ascii=False)
+    for value in PII:
+        assert value not in dumped
+    assert Update.de_json(anonymized, None) is not None
+
+
+def test_anonymize_is_deterministic_and_keeps_routing_fields():
+    anonymizer = TrafficAnonymizer(b"salt")
+    first = anonymizer.anonymize(CALLBACK)
+    assert first == anonymizer.anonymize(CALLBACK)
+    assert first["callback_query"]["data"] == "status|42|В работе"
+    assert first["callback_query"]["message"]["chat"]["id"] < 0
+    assert "vcard" not in anonymizer.anonymize(CONTACT)["message"]["contact"]
+
+
+def test_anonymize_keeps_menu_buttons_and_commands():
+    anonymizer = TrafficAnonymizer(b"salt", keep_texts={"✅ Готово"})
+    assert anonymizer.anonymize_text("✅ Готово") == "✅ Готово"
+    assert anonymizer.anonymize_text("/start") == "/start"
+    assert anonymizer.anonymize_text("ул. Тверская, 7").startswith("addr:")